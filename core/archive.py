@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedFriendRequest, FriendRequest
+
+# Statuses no transition leaves, the requests archive_batch moves
+RESOLVED = ("accepted", "rejected")
+
+# Columns copied from FriendRequest, the id included
+COLUMNS = ("id", "from_user_id", "to_user_id", "status", "created_at")
+
+
+def archive_batch(created_before, after_id: int = 0, batch_size: int = 1000) -> tuple:
+    """
+    Move up to `batch_size` resolved requests created before
+    `created_before`, with ids above `after_id`, to ArchivedFriendRequest
+    in one transaction. Returns (moved, last id seen), moved is 0 once
+    none are left.
+
+    Pending lists and counters only involve pending requests, so no cached
+    version changes. Sending the same request again stays refused, see
+    transitions.send_errors.
+    """
+    with transaction.atomic():
+        # Locked so a status edit can't slip between the copy and the delete
+        rows = list(
+            FriendRequest.objects.select_for_update()
+            .filter(id__gt=after_id, status__in=RESOLVED, created_at__lt=created_before)
+            .order_by("id")
+            .values_list(*COLUMNS)[:batch_size]
+        )
+        if not rows:
+            return 0, after_id
+        now = timezone.now()
+        ArchivedFriendRequest.objects.bulk_create(
+            [
+                ArchivedFriendRequest(**dict(zip(COLUMNS, row)), archived_at=now)
+                for row in rows
+            ]
+        )
+        ids = [row[0] for row in rows]
+        FriendRequest.objects.filter(id__in=ids).delete()
+    return len(rows), ids[-1]
+
+
+def purge_batch(archived_before, batch_size: int = 1000) -> int:
+    """
+    Delete up to `batch_size` archived requests archived before
+    `archived_before`. Returns how many were deleted.
+    """
+    with transaction.atomic():
+        ids = list(
+            ArchivedFriendRequest.objects.filter(archived_at__lt=archived_before)
+            .order_by("archived_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        ArchivedFriendRequest.objects.filter(id__in=ids).delete()
+    return len(ids)
@@ -0,0 +1,379 @@
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate, get_user, login as auth_login
+from django.contrib.auth.hashers import make_password
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.exceptions import AuthenticationFailed
+
+from .auth_viewsets import new_user
+from .authentication import auser_for_token, bearer_token, issue_token, token_ttl
+from .friend_graph import friend_graph
+from .hashing import PoolBusy, hashing_pool
+from .list_versions import etag_matches, list_versions
+from .models import FriendRequest, User
+from .pagination import InvalidCursor, akeyset_page, keyset_slice
+from .renderers import render_json
+from .replicas import DIRECTORY_SCOPE, list_scopes, replicas
+from .search_cache import normalize_query, search_cache
+from .search_index import search_usernames
+from .serializers import (
+    LoginSerializer,
+    SignupSerializer,
+    friend_request_values,
+    user_values,
+)
+
+PAGE_SIZE = 10
+
+
+def json_response(data, status=200) -> HttpResponse:
+    # Same bytes as the DRF JSON renderer
+    return HttpResponse(
+        render_json(data), status=status, content_type="application/json"
+    )
+
+
+def error_response(detail: str, status: int) -> HttpResponse:
+    return json_response({"detail": detail}, status=status)
+
+
+def csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt hides that a view is a
+    # coroutine function before Django 5.0
+    view.csrf_exempt = True
+    return view
+
+
+def busy_response() -> HttpResponse:
+    response = error_response(
+        "Too many logins and signups in progress. Try again later.", 503
+    )
+    response["Retry-After"] = str(hashing_pool.retry_after)
+    return response
+
+
+def request_data(request):
+    """
+    The JSON or form body of a POST request. Raises ValueError if the
+    JSON is malformed.
+    """
+    if request.content_type == "application/json":
+        return json.loads(request.body or b"{}")
+    return request.POST
+
+
+async def authenticated_user(request):
+    """
+    The bearer token or session user of the request, or None for
+    anonymous requests. Raises AuthenticationFailed for invalid tokens.
+    """
+    token = bearer_token(request)
+    if token is not None:
+        return await auser_for_token(token)
+    user = await sync_to_async(get_user)(request)
+    return user if user.is_authenticated else None
+
+
+def not_authenticated(
+    detail: str = "Authentication credentials were not provided.",
+) -> HttpResponse:
+    return error_response(detail, 403)
+
+
+async def list_etag(request, user) -> tuple:
+    """
+    Version of the user's lists and the ETag of the requested one,
+    as (version, etag).
+    """
+    version = await sync_to_async(list_versions.version)(user.pk)
+    variant = f"{request.get_full_path()}|application/json"
+    return version, list_versions.etag(user.pk, version, variant)
+
+
+def not_modified(etag: str) -> HttpResponseNotModified:
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+def page_bounds(request, count: int):
+    """
+    Validate the `page` query parameter like django's Paginator.
+    Returns (page_number, total_pages, offset) or None if the page is invalid.
+    """
+    page_number = request.GET.get("page", 1)
+    total_pages = max(1, math.ceil(count / PAGE_SIZE))
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        return None
+    if number < 1 or number > total_pages:
+        return None
+    return page_number, total_pages, (number - 1) * PAGE_SIZE
+
+
+async def cursor_response(request, page: list, next_cursor, prev_cursor, count):
+    """
+    Keyset paginated response, like UserViewSet.cursor_page. `count` is
+    awaited for the total, only when asked for with `include_total=true`.
+    """
+    response_data = {
+        "results": user_values.to_representation(page),
+        "next": next_cursor,
+        "prev": prev_cursor,
+    }
+    if request.GET.get("include_total") == "true":
+        response_data["total_users"] = await count()
+    return json_response(response_data)
+
+
+def invalid_cursor() -> HttpResponse:
+    return error_response("Invalid cursor.", 400)
+
+
+async def search(request):
+    """
+    Async version of UserViewSet.search, same parameters and response,
+    cursor paginated with `cursor` and `include_total`.
+    """
+    try:
+        user = await authenticated_user(request)
+    except AuthenticationFailed as exc:
+        return not_authenticated(exc.detail)
+    if not user:
+        return not_authenticated()
+
+    query = request.GET.get("query")
+    if not query:
+        return error_response('Query parameter "query" is required.', 400)
+
+    if "cursor" in request.GET:
+        with replicas.reading(DIRECTORY_SCOPE):
+            return await search_cursor_page(request, query)
+
+    # Cached until the user directory changes, shared with UserViewSet.search
+    key = (normalize_query(query), request.GET.get("page", 1))
+    version = await sync_to_async(search_cache.version)()
+    response_data = search_cache.get(key, version)
+    if response_data is None:
+        with replicas.reading(DIRECTORY_SCOPE):
+            response_data = await search_page(request, query)
+        if response_data is None:
+            return error_response("Invalid page.", 404)
+        search_cache.set(key, response_data, version)
+    return json_response(response_data)
+
+
+async def email_match(query: str):
+    """
+    The user whose email is exactly `query`, or None.
+    """
+    matches = [
+        row async for row in user_values.queryset(User.objects.filter(email=query))
+    ]
+    return matches[0] if matches else None
+
+
+async def search_cursor_page(request, query: str) -> HttpResponse:
+    match = await email_match(query)
+    if match:
+        return json_response(match)
+
+    # Search users by name (case insensitive)
+    name_partial_match = user_values.queryset(search_usernames(query))
+    try:
+        page, next_cursor, prev_cursor = await akeyset_page(
+            name_partial_match, request.GET.get("cursor"), PAGE_SIZE
+        )
+    except InvalidCursor:
+        return invalid_cursor()
+    return await cursor_response(
+        request, page, next_cursor, prev_cursor, name_partial_match.acount
+    )
+
+
+async def search_page(request, query: str):
+    """
+    The search response data, or None if the page is invalid.
+    """
+    # Search users by email, this needs to be an exact search
+    match = await email_match(query)
+    if match:
+        return match
+
+    # Search users by name (case insensitive)
+    name_partial_match = user_values.queryset(search_usernames(query))
+    total_users = await name_partial_match.acount()
+    bounds = page_bounds(request, total_users)
+    if bounds is None:
+        return None
+    page_number, total_pages, offset = bounds
+
+    page = [row async for row in name_partial_match[offset : offset + PAGE_SIZE]]
+    return {
+        "results": user_values.to_representation(page),
+        "page_number": page_number,
+        "total_users": total_users,
+        "total_pages": total_pages,
+    }
+
+
+async def friends(request):
+    """
+    Async version of UserViewSet.friends, same parameters and response,
+    cursor paginated with `cursor` and `include_total`.
+    """
+    try:
+        user = await authenticated_user(request)
+    except AuthenticationFailed as exc:
+        return not_authenticated(exc.detail)
+    if not user:
+        return not_authenticated()
+
+    version, etag = await list_etag(request, user)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
+
+    with replicas.reading(*list_scopes(user.pk)):
+        friend_ids = await friend_graph.afriend_ids(user.pk, version[0])
+
+        async def users(ids) -> list:
+            page_users = user_values.queryset(
+                User.objects.filter(id__in=ids).order_by("id")
+            )
+            return [row async for row in page_users]
+
+        if "cursor" in request.GET:
+            try:
+                page_ids, next_cursor, prev_cursor = keyset_slice(
+                    friend_ids, request.GET.get("cursor"), PAGE_SIZE
+                )
+            except InvalidCursor:
+                return invalid_cursor()
+
+            async def count() -> int:
+                return len(friend_ids)
+
+            response = await cursor_response(
+                request, await users(page_ids), next_cursor, prev_cursor, count
+            )
+            response["ETag"] = etag
+            return response
+
+        bounds = page_bounds(request, len(friend_ids))
+        if bounds is None:
+            return error_response("Invalid page.", 404)
+        page_number, total_pages, offset = bounds
+        page = await users(list(friend_ids[offset : offset + PAGE_SIZE]))
+    response = json_response(
+        {
+            "results": user_values.to_representation(page),
+            "page_number": page_number,
+            "total_users": len(friend_ids),
+            "total_pages": total_pages,
+        }
+    )
+    response["ETag"] = etag
+    return response
+
+
+async def friend_requests(request):
+    """
+    Async version of FriendRequestViewSet.list, same parameters and response.
+    """
+    try:
+        user = await authenticated_user(request)
+    except AuthenticationFailed as exc:
+        return not_authenticated(exc.detail)
+    if not user:
+        return not_authenticated()
+
+    _, etag = await list_etag(request, user)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
+
+    type = request.GET.get("type")
+    queryset = FriendRequest.objects.filter(status="pending")
+    if not type:
+        queryset = queryset.filter(Q(to_user=user) | Q(from_user=user))
+    elif type == "received":
+        queryset = queryset.filter(to_user=user)
+    elif type == "sent":
+        queryset = queryset.filter(from_user=user)
+    else:
+        queryset = queryset.none()
+
+    with replicas.reading(*list_scopes(user.pk)):
+        rows = [row async for row in friend_request_values.queryset(queryset)]
+    response = json_response(friend_request_values.to_representation(rows))
+    response["ETag"] = etag
+    return response
+
+
+@csrf_exempt
+async def login(request):
+    """
+    Async version of UserAuthViewSet.login, same parameters and response.
+    The event loop keeps serving other requests while the password is
+    checked in the hashing pool.
+    """
+    if request.method != "POST":
+        return error_response(f'Method "{request.method}" not allowed.', 405)
+    try:
+        serializer = LoginSerializer(data=request_data(request))
+    except ValueError as exc:
+        return error_response(f"JSON parse error - {exc}", 400)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, 400)
+
+    try:
+        user = await hashing_pool.arun(
+            authenticate,
+            username=serializer.validated_data["username"],
+            password=serializer.validated_data["password"],
+        )
+    except PoolBusy:
+        return busy_response()
+    if not user:
+        return error_response("Invalid username or password.", 400)
+
+    await sync_to_async(auth_login)(request, user)
+    return json_response(
+        {
+            "detail": "Login successful.",
+            "token": issue_token(user),
+            "expires_in": token_ttl,
+        }
+    )
+
+
+@csrf_exempt
+async def signup(request):
+    """
+    Async version of UserAuthViewSet.signup, same parameters and response.
+    """
+    if request.method != "POST":
+        return error_response(f'Method "{request.method}" not allowed.', 405)
+    try:
+        serializer = SignupSerializer(data=request_data(request))
+    except ValueError as exc:
+        return error_response(f"JSON parse error - {exc}", 400)
+    # Validation checks the email is not taken
+    if not await sync_to_async(serializer.is_valid)():
+        return json_response(serializer.errors, 400)
+
+    try:
+        password_hash = await hashing_pool.arun(
+            make_password, serializer.validated_data["password"]
+        )
+    except PoolBusy:
+        return busy_response()
+    await sync_to_async(new_user)(
+        username=serializer.validated_data["username"],
+        email=serializer.validated_data["email"],
+        password_hash=password_hash,
+    )
+    return json_response({"detail": "Signup successful."})
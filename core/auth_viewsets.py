@@ -5,10 +5,39 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import BasicAuthentication
 from rest_framework.decorators import action
 from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth.hashers import make_password
+from .authentication import (
+    BearerTokenAuthentication,
+    issue_token,
+    revoke_tokens,
+    token_ttl,
+)
+from .hashing import PoolBusy, hashing_pool
 from .models import User as User
 from .serializers import LoginSerializer, SignupSerializer
 
 
+def busy_response() -> Response:
+    return Response(
+        {"detail": "Too many logins and signups in progress. Try again later."},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(hashing_pool.retry_after)},
+    )
+
+
+def new_user(username: str, email: str, password_hash: str) -> User:
+    """
+    Same as User.objects.create_user, with the password already hashed.
+    """
+    user = User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        password=password_hash,
+    )
+    user.save()
+    return user
+
+
 class UserAuthViewSet(ViewSet):
     """
     Viewset to handle user authentication related APIS
@@ -23,10 +52,22 @@ class UserAuthViewSet(ViewSet):
         if serializer.is_valid():
             username = serializer.validated_data["username"]
             password = serializer.validated_data["password"]
-            user = authenticate(username=username, password=password)
+            # Hashing runs in a bounded pool, see core/hashing.py
+            try:
+                user = hashing_pool.run(
+                    authenticate, username=username, password=password
+                )
+            except PoolBusy:
+                return busy_response()
             if user:
                 login(request, user)
-                return Response({"detail": "Login successful."})
+                return Response(
+                    {
+                        "detail": "Login successful.",
+                        "token": issue_token(user),
+                        "expires_in": token_ttl,
+                    }
+                )
             else:
                 return Response(
                     {"detail": "Invalid username or password."},
@@ -39,10 +80,16 @@ class UserAuthViewSet(ViewSet):
     def signup(self, request):
         serializer = SignupSerializer(data=request.data)
         if serializer.is_valid():
-            _ = User.objects.create_user(
+            try:
+                password_hash = hashing_pool.run(
+                    make_password, serializer.validated_data["password"]
+                )
+            except PoolBusy:
+                return busy_response()
+            _ = new_user(
                 username=serializer.validated_data["username"],
                 email=serializer.validated_data["email"],
-                password=serializer.validated_data["password"],
+                password_hash=password_hash,
             )
             return Response({"detail": "Signup successful."})
         else:
@@ -52,8 +99,10 @@ class UserAuthViewSet(ViewSet):
         detail=False,
         methods=["post"],
         permission_classes=[IsAuthenticated],
-        authentication_classes=[BasicAuthentication],
+        authentication_classes=[BearerTokenAuthentication, BasicAuthentication],
     )
     def logout(self, request):
+        # Also ends the tokens the user holds on other devices
+        revoke_tokens(request.user)
         logout(request)
         return Response({"detail": "Logout successful."})
@@ -0,0 +1,180 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import User
+
+SALT = "core.authentication.token"
+KEYWORD = b"bearer"
+
+
+class UserCache:
+    """
+    Per-process LRU cache of the users bearer tokens authenticate.
+
+    Entries expire after `ttl` seconds, which bounds how long a user
+    edited or a token revoked by another process is still seen as before.
+    Saves and deletes in this process drop the entry right away, see
+    core/signals.py. Callers get a copy, a cached instance is never
+    shared between requests.
+    """
+
+    def __init__(self, max_users: int = 10000, ttl: float = 30):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, token_version: int):
+        """
+        The cached user, or None if it must be loaded. A token newer than
+        the cached user means it was revoked and reissued elsewhere since
+        the user was cached.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if (
+                entry
+                and time.monotonic() - entry[1] < self.ttl
+                and entry[0].token_version >= token_version
+            ):
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return copy.copy(entry[0])
+            self.misses += 1
+            return None
+
+    def set(self, user: User) -> None:
+        with self._lock:
+            self._entries[user.pk] = (copy.copy(user), time.monotonic())
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def issue_token(user: User) -> str:
+    """
+    Signed bearer token of `user`, valid for TOKEN_AUTH["TTL"] seconds or
+    until the user's tokens are revoked.
+    """
+    signer = signing.TimestampSigner(salt=SALT)
+    return signer.sign(f"{user.pk}.{user.token_version}")
+
+
+def revoke_tokens(user: User) -> None:
+    """
+    Revoke every token issued to `user` so far.
+    """
+    User.objects.filter(pk=user.pk).update(token_version=F("token_version") + 1)
+    # update() skips the post_save signal dropping the cached user
+    transaction.on_commit(lambda: user_cache.invalidate(user.pk))
+
+
+def parse_token(token: str) -> tuple:
+    """
+    (user id, token version) of a token. Raises AuthenticationFailed if
+    its signature is invalid or it expired.
+    """
+    signer = signing.TimestampSigner(salt=SALT)
+    try:
+        value = signer.unsign(token, max_age=token_ttl)
+    except signing.SignatureExpired:
+        raise AuthenticationFailed("Token expired.")
+    except signing.BadSignature:
+        raise AuthenticationFailed("Invalid token.")
+    user_id, token_version = value.split(".")
+    return int(user_id), int(token_version)
+
+
+def check_user(user, token_version: int) -> User:
+    if user is None or not user.is_active:
+        raise AuthenticationFailed("User inactive or deleted.")
+    if user.token_version != token_version:
+        raise AuthenticationFailed("Token revoked.")
+    return user
+
+
+def user_for_token(token: str) -> User:
+    """
+    The user a token authenticates. Raises AuthenticationFailed if the
+    token is invalid, expired or revoked.
+    """
+    user_id, token_version = parse_token(token)
+    user = user_cache.get(user_id, token_version)
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            user_cache.set(user)
+    return check_user(user, token_version)
+
+
+async def auser_for_token(token: str) -> User:
+    """
+    Async version of user_for_token.
+    """
+    user_id, token_version = parse_token(token)
+    user = user_cache.get(user_id, token_version)
+    if user is None:
+        user = await User.objects.filter(pk=user_id).afirst()
+        if user is not None:
+            user_cache.set(user)
+    return check_user(user, token_version)
+
+
+def bearer_token(request):
+    """
+    The token of an `Authorization: Bearer <token>` header, or None.
+    Raises AuthenticationFailed if the header is malformed.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != KEYWORD:
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed("Invalid token header.")
+    try:
+        return auth[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed("Invalid token header.")
+
+
+class BearerTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates `Authorization: Bearer <token>` requests with the tokens
+    returned by login. Neither the session nor, once cached, the user is
+    read from the database.
+    """
+
+    def authenticate(self, request):
+        token = bearer_token(request)
+        if token is None:
+            return None
+        return user_for_token(token), token
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+_config = getattr(settings, "TOKEN_AUTH", {})
+token_ttl = _config.get("TTL", 24 * 60 * 60)
+user_cache = UserCache(
+    max_users=_config.get("MAX_USERS", 10000),
+    ttl=_config.get("USER_TTL", 30),
+)
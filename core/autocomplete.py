@@ -0,0 +1,261 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.functions import Lower
+
+from .models import User
+
+
+class PackedUsernames:
+    """
+    Read-only sorted list of usernames packed into one UTF-8 buffer.
+    Costs the username bytes plus 16 bytes of offsets and ids per user,
+    instead of a Python object per user.
+    """
+
+    def __init__(self, rows):
+        # rows: (key, username, id) tuples, sorted, read once
+        offsets = array("Q", [0])
+        ids = array("q")
+        buffer = bytearray()
+        for _, username, user_id in rows:
+            buffer += username.encode()
+            offsets.append(len(buffer))
+            ids.append(user_id)
+        self.buffer = bytes(buffer)
+        self.offsets = offsets
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def username(self, i: int) -> str:
+        return self.buffer[self.offsets[i] : self.offsets[i + 1]].decode()
+
+    def key(self, i: int) -> str:
+        return self.username(i).lower()
+
+    def rows(self):
+        for i in range(len(self)):
+            username = self.username(i)
+            yield username.lower(), username, self.ids[i]
+
+    def lower_bound(self, prefix: str) -> int:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class AutocompleteIndex:
+    """
+    In-process prefix index over usernames.
+
+    Lookups never touch the database once the index is built. The build
+    and merges run in a background thread, lookups keep being served
+    meanwhile: from the database until the first build completes, then
+    from the previous base until the merged one is swapped in.
+
+    New usernames go to a small sorted delta list which is merged into the
+    packed base once it grows past `merge_threshold`. Renamed or deleted
+    users are masked through `overrides` until the next merge. Users
+    created by other processes are picked up every `refresh_interval`
+    seconds by reading ids above the highest id seen. Changes made while
+    the first build runs are queued the same way and kept by the swap.
+    """
+
+    def __init__(self, merge_threshold: int = 10000, refresh_interval: float = 30):
+        self.merge_threshold = merge_threshold
+        self.refresh_interval = refresh_interval
+        self.base = None
+        self.delta = []
+        self.overrides = {}
+        self.max_id = 0
+        self.refreshed_at = 0.0
+        # Held only to read or swap the structures, never while building
+        self._lock = threading.RLock()
+        self._worker = None
+
+    def start(self) -> None:
+        """
+        Build the index in a background thread, unless built or building.
+        """
+        with self._lock:
+            if self.base is None:
+                self._run_in_background(self.build)
+
+    def wait(self, timeout: float = None) -> None:
+        """
+        Wait for the running build or merge, if any.
+        """
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def _run_in_background(self, task) -> None:
+        # Called under the lock, one build or merge at a time
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        def run():
+            try:
+                task()
+            finally:
+                # The thread's own connection, opened by build()
+                connection.close()
+
+        self._worker = threading.Thread(target=run, name="autocomplete", daemon=True)
+        self._worker.start()
+
+    def build(self) -> None:
+        rows = sorted(
+            (username.lower(), username, user_id)
+            for user_id, username in User.objects.values_list(
+                "id", "username"
+            ).iterator(chunk_size=10000)
+        )
+        base = PackedUsernames(rows)
+        with self._lock:
+            # The delta and overrides hold what changed while building
+            self.base = base
+            self.max_id = max(self.max_id, max(self.base.ids, default=0))
+            self.refreshed_at = time.monotonic()
+
+    def add(self, user_id: int, username: str, created: bool = True) -> None:
+        """
+        Index a new username, or the new username of an existing user.
+        """
+        with self._lock:
+            row = (username.lower(), username, user_id)
+            # While building, the base may or may not hold the user yet,
+            # an override shows them from the delta only
+            if not created or self.base is None:
+                self.overrides[user_id] = username
+            i = bisect_left(self.delta, row)
+            if i == len(self.delta) or self.delta[i] != row:
+                self.delta.insert(i, row)
+            self.max_id = max(self.max_id, user_id)
+            if self.base is not None and len(self.delta) > self.merge_threshold:
+                self._run_in_background(self._merge)
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            self.overrides[user_id] = None
+
+    @staticmethod
+    def _visible(overrides: dict, user_id: int, username: str, in_delta: bool):
+        if user_id not in overrides:
+            return True
+        # Overridden users are only shown from the delta, under their new name
+        return in_delta and overrides[user_id] == username
+
+    def _merge(self) -> None:
+        with self._lock:
+            base, delta, overrides = self.base, list(self.delta), dict(self.overrides)
+
+        # Outside the lock, lookups and signups go on with the old base.
+        # Both runs are sorted, streamed into the new buffer in one pass
+        merged = PackedUsernames(
+            heapq.merge(
+                (
+                    row
+                    for row in base.rows()
+                    if self._visible(overrides, row[2], row[1], False)
+                ),
+                (
+                    row
+                    for row in delta
+                    if self._visible(overrides, row[2], row[1], True)
+                ),
+            )
+        )
+
+        with self._lock:
+            self.base = merged
+            # Keep what changed while merging for the next merge
+            merged_rows = set(delta)
+            self.delta = [row for row in self.delta if row not in merged_rows]
+            self.overrides = {
+                user_id: username
+                for user_id, username in self.overrides.items()
+                if user_id not in overrides or overrides[user_id] != username
+            }
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self.refreshed_at < self.refresh_interval:
+            return
+        self.refreshed_at = now
+        new_users = User.objects.filter(id__gt=self.max_id).values_list(
+            "id", "username"
+        )
+        for user_id, username in new_users:
+            self.add(user_id, username)
+
+    def _query(self, prefix: str, limit: int) -> list:
+        # Used while the index is being built. SQLite's LIKE and LOWER()
+        # only fold ASCII, so non-ASCII usernames may match or sort
+        # differently than in the index
+        users = (
+            User.objects.filter(username__istartswith=prefix)
+            .order_by(Lower("username"), "username", "id")
+            .values_list("id", "username")
+        )
+        return list(users[:limit])
+
+    def complete(self, prefix: str, limit: int = 10) -> list:
+        """
+        First `limit` (id, username) pairs whose username starts with
+        `prefix`, case insensitive, in alphabetical order.
+        """
+        if self.base is None:
+            self.start()
+            return self._query(prefix, limit)
+        self._refresh()
+        prefix = prefix.lower()
+
+        with self._lock:
+            base, overrides = self.base, self.overrides
+            matches = []
+            i = base.lower_bound(prefix)
+            while i < len(base) and len(matches) < limit:
+                username = base.username(i)
+                if not username.lower().startswith(prefix):
+                    break
+                user_id = base.ids[i]
+                if self._visible(overrides, user_id, username, False):
+                    matches.append((username.lower(), username, user_id))
+                i += 1
+
+            found = 0
+            i = bisect_left(self.delta, (prefix,))
+            while i < len(self.delta) and found < limit:
+                key, username, user_id = self.delta[i]
+                if not key.startswith(prefix):
+                    break
+                if self._visible(overrides, user_id, username, True):
+                    matches.append(self.delta[i])
+                    found += 1
+                i += 1
+
+        matches.sort()
+        return [(user_id, username) for _, username, user_id in matches[:limit]]
+
+
+# Built in the background by start(), called when the WSGI and ASGI
+# applications load, or else on the first lookup. Django discourages
+# queries while apps load, so not from AppConfig.ready()
+_config = getattr(settings, "AUTOCOMPLETE", {})
+index = AutocompleteIndex(
+    merge_threshold=_config.get("MERGE_THRESHOLD", 10000),
+    refresh_interval=_config.get("REFRESH_INTERVAL", 30),
+)
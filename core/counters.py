@@ -0,0 +1,98 @@
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import FriendRequest, User
+
+FIELDS = ("friend_count", "pending_received_count", "pending_sent_count")
+
+
+def _add(field: str, user_ids, sign: int = 1) -> None:
+    """
+    Add `sign` to `field` of each user, once per occurrence in `user_ids`,
+    with one UPDATE per distinct delta. Runs in the caller's transaction.
+    """
+    by_delta = {}
+    for user_id, count in Counter(user_ids).items():
+        by_delta.setdefault(sign * count, []).append(user_id)
+    for delta, ids in by_delta.items():
+        User.objects.filter(pk__in=ids).update(**{field: F(field) + delta})
+
+
+def pending_added(pairs) -> None:
+    """
+    Count new pending requests, given as (from_user_id, to_user_id).
+    """
+    pairs = list(pairs)
+    _add("pending_sent_count", (from_id for from_id, _ in pairs))
+    _add("pending_received_count", (to_id for _, to_id in pairs))
+
+
+def pending_removed(pairs) -> None:
+    """
+    Uncount pending requests accepted, rejected or deleted, given as
+    (from_user_id, to_user_id).
+    """
+    pairs = list(pairs)
+    _add("pending_sent_count", (from_id for from_id, _ in pairs), -1)
+    _add("pending_received_count", (to_id for _, to_id in pairs), -1)
+
+
+def friendships_added(pairs) -> None:
+    """
+    Count new (user_id, friend_id) friendships, on both users.
+    """
+    _add("friend_count", (user_id for pair in pairs for user_id in pair))
+
+
+def friendships_removed(pairs) -> None:
+    """
+    Uncount removed (user_id, friend_id) friendships, on both users.
+    """
+    _add("friend_count", (user_id for pair in pairs for user_id in pair), -1)
+
+
+def _counted(queryset, field: str):
+    # Rows of `queryset` whose `field` is the outer user, 0 when none
+    counts = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(n=Count("*"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def expected_counts() -> dict:
+    """
+    Expressions computing each counter from the friends and friend
+    request tables.
+    """
+    pending = FriendRequest.objects.filter(status="pending")
+    return {
+        "friend_count": _counted(User.friends.through.objects.all(), "from_user_id"),
+        "pending_received_count": _counted(pending, "to_user_id"),
+        "pending_sent_count": _counted(pending, "from_user_id"),
+    }
+
+
+def drifted(users):
+    """
+    The users of `users` whose counters differ from the tables.
+    """
+    expected = {f"expected_{field}": expr for field, expr in expected_counts().items()}
+    return users.annotate(**expected).exclude(
+        **{field: F(f"expected_{field}") for field in FIELDS}
+    )
+
+
+def recount(users, fields=FIELDS) -> int:
+    """
+    Recompute the counters of `users` from the tables in one UPDATE, so
+    transitions running meanwhile are not overwritten with stale counts.
+    Returns the number of users updated.
+    """
+    expected = expected_counts()
+    return users.update(**{field: expected[field] for field in fields})
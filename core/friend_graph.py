@@ -0,0 +1,180 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import User
+
+
+class FriendGraphCache:
+    """
+    Per-process LRU cache of each user's friend ids as a sorted array('q').
+
+    A miss reads the ids straight from the friends through table, without
+    joining core_user. Entries are replaced rather than mutated, so arrays
+    handed out to callers never change under them. Entries expire after
+    `ttl` seconds to bound staleness from writes made by other processes.
+
+    Readers that know the user's list version (see core/list_versions.py)
+    pass it along, an entry loaded at another version is then a miss, so
+    writes made by other processes are seen right away.
+
+    Writers patch entries once their transaction commits, see
+    transitions.add_friendships and signals.update_friend_graph. A load
+    that overlaps a patch or an invalidation may have read the ids from
+    before it, its result is returned but not cached.
+    """
+
+    def __init__(self, max_users: int = 10000, ttl: float = 60):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every patch and invalidation, checked by loads
+        self._changes = 0
+
+    def _query(self, user_id: int):
+        return (
+            User.friends.through.objects.filter(from_user_id=user_id)
+            .order_by("to_user_id")
+            .values_list("to_user_id", flat=True)
+        )
+
+    def _load(self, user_id: int) -> array:
+        return array("q", self._query(user_id))
+
+    async def _aload(self, user_id: int) -> array:
+        return array("q", [pk async for pk in self._query(user_id)])
+
+    def _store(self, user_id: int, ids: array, version, changes: int) -> None:
+        if changes != self._changes:
+            # Changed while loading, the ids may predate the change
+            return
+        self._entries[user_id] = (ids, time.monotonic(), version)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def _cached(self, user_id: int, version=None):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if (
+                entry
+                and time.monotonic() - entry[1] < self.ttl
+                and (version is None or entry[2] == version)
+            ):
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def friend_ids(self, user_id: int, version=None) -> array:
+        """
+        Sorted ids of the user's friends. Do not modify the returned array.
+        """
+        ids = self._cached(user_id, version)
+        if ids is not None:
+            return ids
+
+        changes = self._changes
+        ids = self._load(user_id)
+        with self._lock:
+            self._store(user_id, ids, version, changes)
+        return ids
+
+    async def afriend_ids(self, user_id: int, version=None) -> array:
+        """
+        `friend_ids` for async views, a miss uses the async ORM.
+        """
+        ids = self._cached(user_id, version)
+        if ids is not None:
+            return ids
+
+        changes = self._changes
+        ids = await self._aload(user_id)
+        with self._lock:
+            self._store(user_id, ids, version, changes)
+        return ids
+
+    def is_friend(self, user_id: int, other_id: int) -> bool:
+        ids = self.friend_ids(user_id)
+        i = bisect_left(ids, other_id)
+        return i < len(ids) and ids[i] == other_id
+
+    def _patch(self, user_id: int, other_id: int, add: bool) -> None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        ids = entry[0]
+        i = bisect_left(ids, other_id)
+        present = i < len(ids) and ids[i] == other_id
+        if add and not present:
+            ids = ids[:i] + array("q", [other_id]) + ids[i:]
+        elif not add and present:
+            ids = ids[:i] + ids[i + 1 :]
+        else:
+            return
+        # Keep the original load time so the entry still expires on schedule
+        self._entries[user_id] = (ids, entry[1], entry[2])
+
+    def add_friendship(self, user_id: int, other_id: int) -> None:
+        with self._lock:
+            self._changes += 1
+            self._patch(user_id, other_id, add=True)
+            self._patch(other_id, user_id, add=True)
+
+    def remove_friendship(self, user_id: int, other_id: int) -> None:
+        with self._lock:
+            self._changes += 1
+            self._patch(user_id, other_id, add=False)
+            self._patch(other_id, user_id, add=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._changes += 1
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "users": len(self._entries),
+        }
+
+
+def intersect_sorted(a: array, b: array) -> array:
+    """
+    Sorted intersection of two sorted id arrays.
+    When one side is much smaller each of its ids is binary searched in the
+    other, O(m log n); otherwise the sets are intersected in O(m + n).
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return array("q")
+
+    if len(a) * 16 < len(b):
+        common = array("q")
+        lo = 0
+        for x in a:
+            lo = bisect_left(b, x, lo)
+            if lo == len(b):
+                break
+            if b[lo] == x:
+                common.append(x)
+        return common
+
+    return array("q", sorted(set(a).intersection(b)))
+
+
+_config = getattr(settings, "FRIEND_GRAPH_CACHE", {})
+friend_graph = FriendGraphCache(
+    max_users=_config.get("MAX_USERS", 10000),
+    ttl=_config.get("TTL", 60),
+)
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class PoolBusy(Exception):
+    """
+    Raised when the hashing pool already holds `max_pending` jobs.
+    """
+
+
+class HashingPool:
+    """
+    Bounded thread pool password hashing runs in, see core/auth_viewsets.py
+
+    PBKDF2 releases the GIL, so hashing in `workers` threads caps the CPU
+    a burst of logins and signups takes, whatever the number of server
+    threads. At most `max_pending` jobs are running or queued, further
+    ones raise PoolBusy right away, the caller answers 503 instead of
+    holding a server thread until the queue drains. Keep `max_pending`
+    below the number of server threads so other endpoints keep some.
+
+    With `workers` set to 0 jobs run inline on the calling thread.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 4, retry_after=1):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Created on first use, management commands never start threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="hashing"
+                )
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PoolBusy()
+        try:
+            future = self.executor.submit(self._call, fn, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _call(fn, args, kwargs):
+        # Jobs may query, e.g. authenticate(), pool threads then close
+        # their connection like request threads do
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run `fn` in the pool and return its result. Raises PoolBusy if the
+        pool is full.
+        """
+        if not self.workers:
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def arun(self, fn, *args, **kwargs):
+        """
+        Async version of run, the event loop is not blocked meanwhile.
+        """
+        if not self.workers:
+            return await sync_to_async(fn)(*args, **kwargs)
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+
+_config = getattr(settings, "PASSWORD_HASHING", {})
+hashing_pool = HashingPool(
+    workers=_config.get("WORKERS", 2),
+    max_pending=_config.get("MAX_PENDING", 4),
+    retry_after=_config.get("RETRY_AFTER", 1),
+)
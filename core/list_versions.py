@@ -0,0 +1,102 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.crypto import md5
+from django.utils.http import parse_etags
+
+from .replicas import PROFILES_SCOPE, replicas, user_scope
+
+# Bumped when a username or email changes, both lists render them
+PROFILES_KEY = "user_profiles_version"
+
+
+def _key(user_id: int) -> str:
+    return f"user_lists_version:{user_id}"
+
+
+class ListVersions:
+    """
+    Version counters of each user's friends and friend request lists,
+    kept in the Django cache `alias` so every process sees them.
+
+    Writes changing a user's lists bump the user's version, renames bump
+    a version shared by everyone. List responses carry an ETag derived
+    from both, a client presenting it in If-None-Match gets a 304 without
+    the list being queried.
+    """
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def bump(self, user_ids) -> None:
+        """
+        Invalidate the lists of `user_ids` once the transaction commits,
+        a request served meanwhile would pair old rows with the new version.
+        """
+        user_ids = set(user_ids)
+        if user_ids:
+            transaction.on_commit(lambda: self._bump_users(user_ids))
+
+    def _bump_users(self, user_ids: set) -> None:
+        # Replicas must not serve the new version from the old rows
+        replicas.mark_written(*(user_scope(user_id) for user_id in user_ids))
+        self._incr([_key(user_id) for user_id in user_ids])
+
+    def bump_profiles(self) -> None:
+        transaction.on_commit(self._bump_profiles)
+
+    def _bump_profiles(self) -> None:
+        replicas.mark_written(PROFILES_SCOPE)
+        self._incr([PROFILES_KEY])
+
+    def _incr(self, keys: list) -> None:
+        for key in keys:
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # Never bumped or evicted, a fresh version is a change anyway
+                self.cache.add(key, time.time_ns(), timeout=None)
+
+    def version(self, user_id: int) -> tuple:
+        """
+        (user version, profiles version) of `user_id`.
+        """
+        keys = [_key(user_id), PROFILES_KEY]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # Start from the clock rather than 0, if the key is evicted
+                # the version must not go back to one a client has seen
+                self.cache.add(key, time.time_ns(), timeout=None)
+                versions[key] = self.cache.get(key)
+        return versions[keys[0]], versions[keys[1]]
+
+    def etag(self, user_id: int, version: tuple, variant: str) -> str:
+        """
+        Strong ETag of a list of `user_id` at `version`. `variant` tells
+        apart the representations sharing a version, e.g. the full path
+        and the media type.
+        """
+        value = f"{user_id}:{version[0]}:{version[1]}:{variant}"
+        return '"%s"' % md5(value.encode(), usedforsecurity=False).hexdigest()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches `etag`. If-None-Match uses the
+    weak comparison, a W/ prefix is ignored.
+    """
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return "*" in etags or any(tag.removeprefix("W/") == etag for tag in etags)
+
+
+_config = getattr(settings, "LIST_VERSIONS", {})
+list_versions = ListVersions(alias=_config.get("CACHE_ALIAS", "default"))
@@ -0,0 +1,69 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move accepted and rejected friend requests older than --older-than "
+        "days to the archive table, and delete archived ones after "
+        "--retention days, in batches of their own transaction so writers "
+        "are never blocked for long. Run it periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=float,
+            default=30,
+            help="Archive resolved requests created more than DAYS ago.",
+        )
+        parser.add_argument(
+            "--retention",
+            type=float,
+            default=365,
+            help="Delete requests archived more than DAYS ago, 0 keeps them.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches.",
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than"] < 0 or options["retention"] < 0:
+            raise CommandError("--older-than and --retention can't be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        batch_size, now = options["batch_size"], timezone.now()
+        start = time.perf_counter()
+
+        created_before = now - timedelta(days=options["older_than"])
+        archived = last_id = 0
+        while True:
+            moved, last_id = archive.archive_batch(created_before, last_id, batch_size)
+            archived += moved
+            if moved < batch_size:
+                break
+            time.sleep(options["pause"])
+        self.stdout.write(f"Archived {archived} friend requests.")
+
+        if options["retention"]:
+            archived_before = now - timedelta(days=options["retention"])
+            purged = 0
+            while True:
+                deleted = archive.purge_batch(archived_before, batch_size)
+                purged += deleted
+                if deleted < batch_size:
+                    break
+                time.sleep(options["pause"])
+            self.stdout.write(f"Purged {purged} archived friend requests.")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Done in {elapsed:.1f}s."))
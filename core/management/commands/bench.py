@@ -0,0 +1,237 @@
+import base64
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from core import urls
+from core.authentication import issue_token
+from core.models import FriendRequest, User
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class Context:
+    """
+    Ids and credentials the benchmarked requests are built from.
+    """
+
+    def __init__(self, user: User, password: str):
+        self.user = user
+        self.password = password
+        friend = user.friends.order_by("id").first()
+        self.friend_id = friend.pk if friend else user.pk
+        received = FriendRequest.objects.filter(to_user=user, status="pending")
+        sent = FriendRequest.objects.filter(from_user=user, status="pending")
+        self.received_ids = list(received.values_list("id", flat=True)[:100])
+        self.sent_ids = list(sent.values_list("id", flat=True)[:100])
+        self.received_id = self.received_ids[0] if self.received_ids else 0
+        self.sent_id = self.sent_ids[0] if self.sent_ids else 0
+        self.targets = list(
+            User.objects.exclude(pk=user.pk)
+            .order_by("-id")
+            .values_list("username", flat=True)[:100]
+        )
+        self.signups = 0
+        self.token = issue_token(user)
+
+    def basic_auth(self) -> dict:
+        token = base64.b64encode(f"{self.user.username}:{self.password}".encode())
+        return {"HTTP_AUTHORIZATION": f"Basic {token.decode()}"}
+
+    def signup(self) -> dict:
+        self.signups += 1
+        username = f"bench{time.time_ns()}{self.signups}"
+        return {
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "password123",
+        }
+
+
+# (url name, method) -> function(context) returning (url kwargs, data, extra)
+SCENARIOS = {
+    ("auth-login", "post"): lambda c: (
+        {},
+        {"username": c.user.username, "password": c.password},
+        {},
+    ),
+    ("auth-logout", "post"): lambda c: ({}, {}, c.basic_auth()),
+    ("auth-signup", "post"): lambda c: ({}, c.signup(), {}),
+    ("friend-list", "get"): lambda c: ({}, {}, {}),
+    ("friend-bulk-send", "post"): lambda c: ({}, {"to_users": c.targets}, {}),
+    ("friend-bulk-accept", "post"): lambda c: ({}, {"ids": c.received_ids}, {}),
+    ("friend-bulk-reject", "post"): lambda c: ({}, {"ids": c.received_ids}, {}),
+    ("friend-bulk-cancel", "post"): lambda c: ({}, {"ids": c.sent_ids}, {}),
+    ("friend-export", "get"): lambda c: ({}, {}, {}),
+    ("friend-send-request", "post"): lambda c: ({}, {"to_user": c.targets[0]}, {}),
+    ("friend-detail", "get"): lambda c: ({"pk": c.received_id}, {}, {}),
+    ("friend-detail", "put"): lambda c: (
+        {"pk": c.received_id},
+        {"status": "pending"},
+        {},
+    ),
+    ("friend-detail", "patch"): lambda c: (
+        {"pk": c.received_id},
+        {"status": "pending"},
+        {},
+    ),
+    ("friend-detail", "delete"): lambda c: ({"pk": c.received_id}, {}, {}),
+    ("friend-accept-request", "post"): lambda c: ({"pk": c.received_id}, {}, {}),
+    ("friend-reject-request", "post"): lambda c: ({"pk": c.received_id}, {}, {}),
+    ("friend-cancel-request", "post"): lambda c: ({"pk": c.sent_id}, {}, {}),
+    ("user-autocomplete", "get"): lambda c: ({}, {"query": c.user.username[:3]}, {}),
+    ("user-friends", "get"): lambda c: ({}, {}, {}),
+    ("user-counts", "get"): lambda c: ({}, {}, {}),
+    ("user-friends-export", "get"): lambda c: ({}, {}, {}),
+    ("user-search", "get"): lambda c: ({}, {"query": c.user.username[:4]}, {}),
+    ("user-suggestions", "get"): lambda c: ({}, {}, {}),
+    ("user-mutual-friends", "get"): lambda c: ({"pk": c.friend_id}, {}, {}),
+    ("api-root", "get"): lambda c: ({}, {}, {}),
+    ("async-auth-login", "post"): lambda c: (
+        {},
+        {"username": c.user.username, "password": c.password},
+        {},
+    ),
+    ("async-auth-signup", "post"): lambda c: ({}, c.signup(), {}),
+    ("async-user-search", "get"): lambda c: ({}, {"query": c.user.username[:4]}, {}),
+    ("async-user-friends", "get"): lambda c: ({}, {}, {}),
+    ("async-friend-list", "get"): lambda c: ({}, {}, {}),
+    ("metrics", "get"): lambda c: ({}, {}, {}),
+}
+
+
+def routes() -> list:
+    """
+    (url name, method) of every route in core/urls.py, in order.
+    """
+    found = []
+    for pattern in urls.urlpatterns:
+        actions = getattr(pattern.callback, "actions", None)
+        if actions is None:
+            # Plain views don't list their methods, take the scenarios'
+            actions = [m for name, m in SCENARIOS if name == pattern.name] or ["get"]
+        for method in actions:
+            if (pattern.name, method) not in found:
+                found.append((pattern.name, method))
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every route in core/urls.py through the test client and report "
+        "p50/p95/p99 latency and queries per request. Writes to the database "
+        "are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            help="User the requests are made as, defaults to the one with the "
+            "most friends.",
+        )
+        parser.add_argument("--password", default="password123")
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--output", default="bench_results.json")
+        parser.add_argument(
+            "--auth",
+            choices=["session", "token"],
+            default="session",
+            help="Authenticate with a session cookie or a bearer token.",
+        )
+
+    def handle(self, *args, **options):
+        context = Context(self.bench_user(options["username"]), options["password"])
+        # Expected 4xx responses would log a warning per request
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+
+        results = {}
+        # Rate limits would turn most sends into errors
+        with override_settings(THROTTLES={}):
+            for name, method in routes():
+                scenario = SCENARIOS.get((name, method))
+                key = f"{method.upper()} {name}"
+                if scenario is None:
+                    self.stdout.write(f"{key:<32} skipped, no scenario")
+                    continue
+                results[key] = self.run(name, method, scenario, context, options)
+                self.report(key, results[key])
+
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "username": context.user.username,
+            "iterations": options["iterations"],
+            "auth": options["auth"],
+            "routes": results,
+        }
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def bench_user(self, username) -> User:
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User {username} does not exist.")
+        user = User.objects.annotate(n=Count("friends")).order_by("-n").first()
+        if user is None:
+            raise CommandError("No users, run seed_graph first.")
+        return user
+
+    def run(self, name, method, scenario, context, options) -> dict:
+        # A client per route, login rotates and logout flushes the session
+        if options["auth"] == "token":
+            client = Client(
+                raise_request_exception=False,
+                HTTP_AUTHORIZATION=f"Bearer {context.token}",
+            )
+        else:
+            client = Client(raise_request_exception=False)
+            client.force_login(context.user)
+        latencies, queries, statuses = [], [], {}
+        for _ in range(options["iterations"]):
+            kwargs, data, extra = scenario(context)
+            path = reverse(name, kwargs=kwargs)
+            if method != "get":
+                data = json.dumps(data)
+                extra = {"content_type": "application/json", **extra}
+
+            # Roll back whatever the request writes, so every iteration
+            # runs against the same data
+            with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(client, method)(path, data, **extra)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                latencies.append(time.perf_counter() - start)
+                transaction.set_rollback(True)
+
+            queries.append(len(captured))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        latencies.sort()
+        return {
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queries_per_request": sum(queries) / len(queries),
+            "status_codes": statuses,
+        }
+
+    def report(self, key: str, result: dict) -> None:
+        self.stdout.write(
+            f"{key:<32} p50 {result['p50_ms']:7.2f}ms  p95 {result['p95_ms']:7.2f}ms"
+            f"  p99 {result['p99_ms']:7.2f}ms  {result['queries_per_request']:5.1f} q/req"
+            f"  {result['status_codes']}"
+        )
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from core.models import User
+
+# Read endpoints with a native async version
+ENDPOINTS = {
+    "search": ("/api/user/search/", "/api/async/user/search/"),
+    "friends": ("/api/user/friends/", "/api/async/user/friends/"),
+    "friend_requests": ("/api/friend/", "/api/async/friend/"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput of the sync DRF read endpoints through the WSGI "
+        "handler with their async versions through the ASGI handler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User the requests are made as.")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--query", default="a", help="Search query.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist.")
+
+        params = {"query": options["query"]}
+        for name, (sync_path, async_path) in ENDPOINTS.items():
+            wsgi = self.run_wsgi(user, sync_path, params, options)
+            asgi = asyncio.run(self.run_asgi(user, async_path, params, options))
+            self.stdout.write(
+                f"{name:<16} WSGI {wsgi:8.1f} req/s   ASGI {asgi:8.1f} req/s"
+            )
+
+    def run_wsgi(self, user, path, params, options) -> float:
+        """
+        Requests per second with `concurrency` threads, like a threaded
+        WSGI server.
+        """
+        clients = [Client() for _ in range(options["concurrency"])]
+        for client in clients:
+            client.force_login(user)
+
+        def worker(i):
+            client = clients[i % len(clients)]
+            check_response(path, client.get(path, params))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            list(pool.map(worker, range(options["requests"])))
+        return options["requests"] / (time.perf_counter() - start)
+
+    async def run_asgi(self, user, path, params, options) -> float:
+        """
+        Requests per second with `concurrency` coroutines on one event loop,
+        like a single ASGI worker.
+        """
+        client = AsyncClient()
+        await asyncio.get_running_loop().run_in_executor(None, client.force_login, user)
+        semaphore = asyncio.Semaphore(options["concurrency"])
+
+        async def worker():
+            async with semaphore:
+                check_response(path, await client.get(path, params))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options["requests"])))
+        return options["requests"] / (time.perf_counter() - start)
+
+
+def check_response(path: str, response) -> None:
+    # Failed requests would be timed as if served
+    if response.status_code != 200:
+        raise CommandError(f"{path} returned {response.status_code}.")
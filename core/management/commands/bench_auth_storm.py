@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import AsyncClient, Client
+
+from core.authentication import issue_token
+from core.hashing import hashing_pool
+from core.models import User
+
+from .bench import percentile
+
+# Read endpoints timed during the storm, sync path and async path
+READS = [
+    ("/api/user/friends/", "/api/async/user/friends/"),
+    ("/api/user/search/?query=seed1", "/api/async/user/search/?query=seed1"),
+    ("/api/friend/", "/api/async/friend/"),
+]
+LOGIN = ("/api/auth/login/", "/api/async/auth/login/")
+
+
+def retry_after(response) -> float:
+    # Storm clients back off like well-behaved ones
+    return float(response.get("Retry-After", 0))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure read endpoint latency while a storm of logins hashes "
+        "passwords, through a fixed pool of WSGI server threads and through "
+        "one ASGI event loop. Logins update last_login."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username",
+            help="User the requests are made as, defaults to the one with the "
+            "most friends.",
+        )
+        parser.add_argument("--password", default="password123")
+        parser.add_argument(
+            "--threads", type=int, default=8, help="WSGI server threads."
+        )
+        parser.add_argument(
+            "--storm", type=int, default=16, help="Concurrent login clients."
+        )
+        parser.add_argument(
+            "--duration", type=float, default=5, help="Seconds per phase."
+        )
+        parser.add_argument(
+            "--inline",
+            action="store_true",
+            help="Hash on the request thread, as without the hashing pool.",
+        )
+
+    def handle(self, *args, **options):
+        user = self.bench_user(options["username"])
+        login = {"username": user.username, "password": options["password"]}
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {issue_token(user)}"}
+        # 503s would log an error per request
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+        workers = hashing_pool.workers
+        if options["inline"]:
+            hashing_pool.workers = 0
+        try:
+            for storm in (0, options["storm"]):
+                result = self.run_wsgi(login, headers, storm, options)
+                self.report("WSGI", storm, result)
+            for storm in (0, options["storm"]):
+                result = asyncio.run(self.run_asgi(login, headers, storm, options))
+                self.report("ASGI", storm, result)
+        finally:
+            hashing_pool.workers = workers
+
+    def bench_user(self, username) -> User:
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User {username} does not exist.")
+        user = User.objects.annotate(n=Count("friends")).order_by("-n").first()
+        if user is None:
+            raise CommandError("No users, run seed_graph first.")
+        return user
+
+    def run_wsgi(self, login, headers, storm, options) -> dict:
+        """
+        Reads are timed from submission to a pool of `threads` server
+        threads, so time spent waiting for a thread counts.
+        """
+        stop = threading.Event()
+        logins = {}
+
+        def request(method, path, data=None, **extra):
+            return getattr(Client(), method)(path, data, **extra)
+
+        with ThreadPoolExecutor(options["threads"]) as server:
+
+            def login_loop():
+                while not stop.is_set():
+                    response = server.submit(request, "post", LOGIN[0], login).result()
+                    logins[response.status_code] = (
+                        logins.get(response.status_code, 0) + 1
+                    )
+                    stop.wait(retry_after(response))
+
+            stormers = [threading.Thread(target=login_loop) for _ in range(storm)]
+            for thread in stormers:
+                thread.start()
+
+            latencies = []
+            deadline = time.perf_counter() + options["duration"]
+            while time.perf_counter() < deadline:
+                path = READS[len(latencies) % len(READS)][0]
+                start = time.perf_counter()
+                server.submit(request, "get", path, **headers).result()
+                latencies.append(time.perf_counter() - start)
+
+            stop.set()
+            for thread in stormers:
+                thread.join()
+        return {"latencies": latencies, "logins": logins}
+
+    async def run_asgi(self, login, headers, storm, options) -> dict:
+        """
+        Reads and logins share one event loop, like a single ASGI worker.
+        """
+        stop = asyncio.Event()
+        logins = {}
+        extra = {key.removeprefix("HTTP_"): value for key, value in headers.items()}
+
+        async def login_loop():
+            client = AsyncClient()
+            while not stop.is_set():
+                response = await client.post(LOGIN[1], login)
+                logins[response.status_code] = logins.get(response.status_code, 0) + 1
+                delay = retry_after(response)
+                if delay:
+                    try:
+                        await asyncio.wait_for(stop.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+
+        stormers = [asyncio.create_task(login_loop()) for _ in range(storm)]
+        client = AsyncClient()
+        latencies = []
+        deadline = time.perf_counter() + options["duration"]
+        while time.perf_counter() < deadline:
+            path = READS[len(latencies) % len(READS)][1]
+            start = time.perf_counter()
+            await client.get(path, **extra)
+            latencies.append(time.perf_counter() - start)
+
+        stop.set()
+        await asyncio.gather(*stormers)
+        return {"latencies": latencies, "logins": logins}
+
+    def report(self, handler: str, storm: int, result: dict) -> None:
+        latencies = sorted(result["latencies"])
+        self.stdout.write(
+            f"{handler} storm {storm:3d}  reads {len(latencies):5d}"
+            f"  p50 {percentile(latencies, 0.50) * 1000:8.2f}ms"
+            f"  p95 {percentile(latencies, 0.95) * 1000:8.2f}ms"
+            f"  p99 {percentile(latencies, 0.99) * 1000:8.2f}ms"
+            f"  logins {result['logins']}"
+        )
@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.db.models import Q
+
+from core.models import FriendRequest, User
+
+from .bench import percentile
+
+# Backends compared, the second one with the OPTIONS of the default database
+BACKENDS = [
+    ("plain", "django.db.backends.sqlite3"),
+    ("tuned", "core.sqlite3"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent readers and writers against the default SQLite "
+        "database, through Django's sqlite3 backend in rollback journal mode "
+        "and through core.sqlite3, and report throughput, latency and "
+        "'database is locked' errors. Rows written are deleted again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument(
+            "--duration", type=float, default=5, help="Seconds per backend."
+        )
+
+    def handle(self, *args, **options):
+        default = connections.settings["default"]
+        if "sqlite3" not in default["ENGINE"]:
+            raise CommandError("The default database is not SQLite.")
+        user_ids = list(User.objects.values_list("id", flat=True))
+        if len(user_ids) < 2:
+            raise CommandError("No users, run seed_graph first.")
+        connections["default"].close()
+
+        for label, engine in BACKENDS:
+            alias = f"bench_{label}"
+            connections.settings[alias] = {
+                **default,
+                "ENGINE": engine,
+                "OPTIONS": default["OPTIONS"] if engine == "core.sqlite3" else {},
+                "CONN_MAX_AGE": 0,
+            }
+            if label == "plain":
+                # WAL is stored in the file, go back to the rollback journal
+                # Django's backend runs with by default
+                with connections[alias].cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode = DELETE")
+                connections[alias].close()
+
+            results = self.run(alias, user_ids, options)
+            for role in ("read", "write"):
+                self.report(label, role, results[role], options["duration"])
+
+    def run(self, alias: str, user_ids: list, options) -> dict:
+        results = {role: {"latencies": [], "locked": 0} for role in ("read", "write")}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options["duration"]
+
+        def loop(role: str, operation):
+            rng = random.Random()
+            latencies, locked = [], 0
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        operation(alias, rng.sample(user_ids, 2))
+                    except OperationalError as e:
+                        if "locked" not in str(e):
+                            raise
+                        locked += 1
+                        continue
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connections[alias].close()
+            with lock:
+                results[role]["latencies"] += latencies
+                results[role]["locked"] += locked
+
+        threads = [
+            threading.Thread(target=loop, args=("read", self.read))
+            for _ in range(options["readers"])
+        ] + [
+            threading.Thread(target=loop, args=("write", self.write))
+            for _ in range(options["writers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def read(self, alias: str, users: list) -> None:
+        """
+        First page of a user's friends and their pending friend requests.
+        """
+        user_id = users[0]
+        friends = User.objects.using(alias).filter(friends=user_id).order_by("id")
+        list(friends.values("id", "username", "email")[:10])
+        requests = FriendRequest.objects.using(alias).filter(
+            Q(to_user_id=user_id) | Q(from_user_id=user_id), status="pending"
+        )
+        list(requests.values("id", "from_user__username", "to_user__username"))
+
+    def write(self, alias: str, users: list) -> None:
+        """
+        Send a friend request like send_request, checking for an existing
+        one first, then cancel it.
+        """
+        from_user_id, to_user_id = users
+        with transaction.atomic(using=alias):
+            requests = FriendRequest.objects.using(alias)
+            if requests.filter(
+                from_user_id=from_user_id, to_user_id=to_user_id
+            ).exists():
+                return
+            try:
+                with transaction.atomic(using=alias):
+                    friend_request = requests.create(
+                        from_user_id=from_user_id,
+                        to_user_id=to_user_id,
+                        status="pending",
+                    )
+            except IntegrityError:
+                return
+        # Retried until it goes through, the row must not stay behind
+        while True:
+            try:
+                with transaction.atomic(using=alias):
+                    friend_request.delete(using=alias)
+                return
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+
+    def report(self, label: str, role: str, result: dict, duration: float) -> None:
+        latencies = sorted(result["latencies"]) or [0]
+        self.stdout.write(
+            f"{label:<6} {role:<6} {len(result['latencies']) / duration:8.1f} ops/s"
+            f"  p50 {percentile(latencies, 0.50) * 1000:8.2f}ms"
+            f"  p99 {percentile(latencies, 0.99) * 1000:8.2f}ms"
+            f"  locked {result['locked']}"
+        )
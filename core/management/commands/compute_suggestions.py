@@ -0,0 +1,50 @@
+from array import array
+
+from django.core.management.base import BaseCommand
+
+from core import suggestions
+from core.models import SuggestionRefresh, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute friend suggestions (friends of friends ranked by mutual "
+        "friends) into the FriendSuggestion table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only recompute users whose friendships changed since the last run.",
+        )
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # Read the marks before the graph, so edges changed meanwhile are
+        # marked again and picked up by the next run
+        marks = list(SuggestionRefresh.objects.values_list("user_id", "changed_at"))
+        marked = [user_id for user_id, _ in marks]
+        graph = suggestions.AdjacencyMatrix.load()
+        self.stdout.write(
+            f"Loaded {len(graph.users)} users with {len(graph.indices)} edges."
+        )
+
+        if options["incremental"]:
+            user_ids = suggestions.changed_users(graph, marked)
+        else:
+            user_ids = array(
+                "q", User.objects.order_by("id").values_list("id", flat=True)
+            )
+
+        total = len(user_ids)
+        for done in suggestions.compute(
+            user_ids, graph, options["limit"], options["chunk_size"]
+        ):
+            self.stdout.write(f"{done}/{total} users")
+
+        suggestions.clear_marks(marks)
+        self.stdout.write(
+            self.style.SUCCESS(f"Computed suggestions for {total} users.")
+        )
@@ -0,0 +1,201 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from core import search_index, transitions
+from core.models import User
+from core.search_cache import search_cache
+
+USER_COLUMNS = {"username", "email", "password"}
+EDGE_COLUMNS = {"user", "friend"}
+
+
+def chunks(rows, size: int):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Checkpoint:
+    """
+    Rows of each CSV already imported, saved after every committed chunk.
+    A checkpoint recorded for a different file is ignored.
+    """
+
+    def __init__(self, path: str, restart: bool):
+        self.path = path
+        self.state = {}
+        if not restart and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def rows_done(self, kind: str, csv_path: str) -> int:
+        entry = self.state.get(kind)
+        if entry and entry["path"] == os.path.abspath(csv_path):
+            return entry["rows"]
+        return 0
+
+    def save(self, kind: str, csv_path: str, rows: int) -> None:
+        self.state[kind] = {"path": os.path.abspath(csv_path), "rows": rows}
+        # Write then rename, an interrupted write never leaves a torn file
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.state, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def delete(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users and friendships from CSV files in chunks. Users are read "
+        "from a username,email,password CSV with pre-hashed passwords, "
+        "friendships from a user,friend CSV of usernames. Interrupted imports "
+        "resume from the last committed chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", help="CSV with username,email,password.")
+        parser.add_argument("--edges", help="CSV with user,friend usernames.")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--checkpoint", default="import_graph.checkpoint.json")
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint and import from the first row.",
+        )
+        parser.add_argument(
+            "--hash-passwords",
+            action="store_true",
+            help="Passwords are plain text and hashed on import. Hashing is "
+            "deliberately slow, migrate hashes when possible.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["users"] and not options["edges"]:
+            raise CommandError("Pass --users, --edges or both.")
+
+        checkpoint = Checkpoint(options["checkpoint"], options["restart"])
+        # Users first, edges refer to them by username
+        if options["users"]:
+            self.run("users", options["users"], USER_COLUMNS, checkpoint, options)
+        if options["edges"]:
+            self.run("edges", options["edges"], EDGE_COLUMNS, checkpoint, options)
+        checkpoint.delete()
+
+    def run(self, kind: str, path: str, columns: set, checkpoint, options) -> None:
+        import_chunk = getattr(self, f"import_{kind}")
+        done = checkpoint.rows_done(kind, path)
+        inserted = skipped = read = 0
+        start = time.perf_counter()
+
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            missing = columns - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f"{path} is missing columns: {sorted(missing)}")
+            if done:
+                self.stdout.write(f"{kind}: resuming after row {done}")
+                # Rows are consumed, not parsed into models, skipping is cheap
+                for _ in islice(reader, done):
+                    pass
+
+            for chunk in chunks(reader, options["chunk_size"]):
+                with transaction.atomic():
+                    count = import_chunk(chunk, options)
+                # Only checkpoint committed chunks, replaying one is harmless
+                # since existing rows are skipped
+                read += len(chunk)
+                checkpoint.save(kind, path, done + read)
+                inserted += count
+                skipped += len(chunk) - count
+                rate = read / (time.perf_counter() - start)
+                self.stdout.write(
+                    f"{kind}: {done + read} rows, {inserted} inserted, "
+                    f"{skipped} skipped ({rate:.0f} rows/s)"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {inserted} {kind} from {path}.")
+        )
+
+    def import_users(self, rows: list, options) -> int:
+        """
+        Insert the new users of a chunk. Returns how many were inserted.
+        Rows without a username or email, with an unrecognized password
+        hash, or clashing with an existing user are skipped.
+        """
+        users = {}
+        for row in rows:
+            username, email = row["username"].strip(), row["email"].strip()
+            if not username or not email or username in users:
+                continue
+            password = self.password(row["password"], options["hash_passwords"])
+            if password is not None:
+                users[username] = User(
+                    username=username, email=email, password=password
+                )
+
+        emails = [user.email for user in users.values()]
+        existing = User.objects.filter(Q(username__in=users) | Q(email__in=emails))
+        existing = list(existing.values_list("username", "email"))
+        taken_usernames = {username for username, _ in existing}
+        taken_emails = {email for _, email in existing}
+        users = [
+            user
+            for user in users.values()
+            if user.username not in taken_usernames and user.email not in taken_emails
+        ]
+
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        # ignore_conflicts returns no primary keys, read them back for the
+        # search index, bulk_create skips the signal that maintains it
+        created = User.objects.filter(username__in=[user.username for user in users])
+        created = list(created.values_list("id", "username"))
+        search_index.index_users(created)
+        transaction.on_commit(search_cache.bump)
+        return len(created)
+
+    def password(self, value: str, hash_passwords: bool):
+        """
+        The password to store, or None if the row should be skipped.
+        An empty password gives an unusable password.
+        """
+        if not value:
+            return make_password(None)
+        if hash_passwords:
+            return make_password(value)
+        try:
+            identify_hasher(value)
+        except ValueError:
+            return None
+        return value
+
+    def import_edges(self, rows: list, options) -> int:
+        """
+        Insert the friendships of a chunk. Returns how many were new.
+        Rows naming unknown users or a user twice are skipped.
+        """
+        usernames = {row[column].strip() for row in rows for column in EDGE_COLUMNS}
+        ids = dict(
+            User.objects.filter(username__in=usernames).values_list("username", "id")
+        )
+
+        pairs = set()
+        for row in rows:
+            user_id = ids.get(row["user"].strip())
+            friend_id = ids.get(row["friend"].strip())
+            if user_id and friend_id and user_id != friend_id:
+                pairs.add((min(user_id, friend_id), max(user_id, friend_id)))
+
+        return transitions.add_friendships(pairs)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the username trigram search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = search_index.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} users."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from core import counters
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the friend and pending request counters on each user with "
+        "the friends and friend request tables, and recount the users whose "
+        "counters drifted, e.g. after rows were changed outside the app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted users without fixing them.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = User.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        checked = drifted = 0
+        # Ranges of ids rather than offsets, each batch walks the primary key
+        for start in range(0, last_id, batch_size):
+            users = User.objects.filter(id__gt=start, id__lte=start + batch_size)
+            with transaction.atomic():
+                ids = list(counters.drifted(users).values_list("id", flat=True))
+                if ids and not options["dry_run"]:
+                    counters.recount(User.objects.filter(id__in=ids))
+            checked += users.count()
+            drifted += len(ids)
+            if options["verbosity"] > 1:
+                for user_id in ids:
+                    self.stdout.write(f"User {user_id} drifted.")
+
+        action = "found" if options["dry_run"] else "recounted"
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {checked} users, {action} {drifted} drifted.")
+        )
@@ -0,0 +1,146 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import counters, search_index
+from core.list_versions import list_versions
+from core.models import FriendRequest, User
+from core.search_cache import search_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic users, a power-law friend graph and friend "
+        "requests for benchmarking."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument(
+            "--edges-per-user",
+            type=int,
+            default=5,
+            help="Friendships each new user makes (preferential attachment).",
+        )
+        parser.add_argument("--requests", type=int, default=50000)
+        parser.add_argument("--prefix", default="seed")
+        parser.add_argument("--password", default="password123")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        start = time.perf_counter()
+
+        user_ids = self.create_users(options, batch_size)
+        self.stdout.write(f"Created {len(user_ids)} users.")
+
+        edges = self.power_law_edges(user_ids, options["edges_per_user"], rng)
+        self.create_friendships(edges, batch_size)
+        self.stdout.write(f"Created {len(edges)} friendships.")
+
+        created = self.create_requests(
+            user_ids, edges, options["requests"], rng, batch_size
+        )
+        self.stdout.write(f"Created {created} friend requests.")
+
+        # bulk_create skips the counter updates, recount the seeded users
+        for i in range(0, len(user_ids), batch_size):
+            counters.recount(User.objects.filter(pk__in=user_ids[i : i + batch_size]))
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Seeded graph in {elapsed:.1f}s."))
+
+    def create_users(self, options, batch_size: int) -> list:
+        # Hashing once keeps seeding fast, every user shares the password
+        password = make_password(options["password"])
+        prefix = options["prefix"]
+        offset = User.objects.filter(username__startswith=prefix).count()
+        user_ids = []
+        for start in range(0, options["users"], batch_size):
+            stop = min(start + batch_size, options["users"])
+            users = [
+                User(
+                    username=f"{prefix}{offset + i}",
+                    email=f"{prefix}{offset + i}@example.com",
+                    password=password,
+                )
+                for i in range(start, stop)
+            ]
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                # bulk_create skips signals, index the new usernames here
+                search_index.index_users((user.pk, user.username) for user in users)
+                transaction.on_commit(search_cache.bump)
+            user_ids += [user.pk for user in users]
+        return user_ids
+
+    def power_law_edges(self, user_ids: list, per_user: int, rng) -> set:
+        """
+        Barabasi-Albert preferential attachment: each user befriends
+        `per_user` earlier users picked with probability proportional to
+        their degree, which yields a power-law degree distribution.
+        """
+        edges = set()
+        # Every user appears once per friendship end, so sampling from it
+        # is sampling proportionally to degree
+        endpoints = list(user_ids[: per_user + 1])
+        for i, user_id in enumerate(user_ids[per_user + 1 :], per_user + 1):
+            targets = set()
+            while len(targets) < min(per_user, i):
+                targets.add(rng.choice(endpoints))
+            for target in targets:
+                edges.add((min(user_id, target), max(user_id, target)))
+                endpoints += [user_id, target]
+        return edges
+
+    def create_friendships(self, edges: set, batch_size: int) -> None:
+        Friendship = User.friends.through
+        edges = list(edges)
+        for start in range(0, len(edges), batch_size):
+            Friendship.objects.bulk_create(
+                [
+                    Friendship(from_user_id=a, to_user_id=b)
+                    for user_id, friend_id in edges[start : start + batch_size]
+                    for a, b in ((user_id, friend_id), (friend_id, user_id))
+                ],
+                ignore_conflicts=True,
+            )
+        # bulk_create skips signals, invalidate cached lists here
+        list_versions.bump({user_id for edge in edges for user_id in edge})
+
+    def create_requests(
+        self, user_ids: list, edges: set, count: int, rng, batch_size: int
+    ) -> int:
+        """
+        Accepted requests follow existing friendships. Pending and rejected
+        ones go from random users to users picked proportionally to their
+        degree, popular users get more requests.
+        """
+        edges = list(edges)
+        endpoints = [user_id for edge in edges for user_id in edge] or user_ids
+        before = FriendRequest.objects.count()
+        batch = []
+        for _ in range(count):
+            roll = rng.random()
+            if roll < 0.2 and edges:
+                from_id, to_id = rng.choice(edges)
+                status = "accepted"
+            else:
+                from_id, to_id = rng.choice(user_ids), rng.choice(endpoints)
+                if from_id == to_id:
+                    continue
+                status = "pending" if roll < 0.8 else "rejected"
+            batch.append(
+                FriendRequest(from_user_id=from_id, to_user_id=to_id, status=status)
+            )
+            if len(batch) == batch_size:
+                FriendRequest.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        FriendRequest.objects.bulk_create(batch, ignore_conflicts=True)
+        list_versions.bump(user_ids)
+        return FriendRequest.objects.count() - before
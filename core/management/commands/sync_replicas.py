@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary database into the read replicas with SQLite's "
+        "online backup API. Run it with --interval shorter than "
+        "READ_REPLICAS['LAG_WINDOW'], a replica is only read while its copy "
+        "is younger than that."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="append",
+            help="Replica to sync, defaults to READ_REPLICAS['DATABASES'].",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Sync again every INTERVAL seconds instead of once.",
+        )
+
+    def handle(self, *args, **options):
+        databases = options["database"] or replicas.databases
+        if not databases:
+            raise CommandError(
+                "No replicas, set READ_REPLICAS['DATABASES'] or pass --database."
+            )
+        for database in [DEFAULT_DB_ALIAS, *databases]:
+            if database not in connections.settings:
+                raise CommandError(f"Database {database} is not configured.")
+            if connections[database].vendor != "sqlite":
+                raise CommandError(f"Database {database} is not SQLite.")
+        if DEFAULT_DB_ALIAS in databases:
+            raise CommandError("The primary database can't be a replica.")
+
+        while True:
+            for database in databases:
+                self.sync(database)
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
+
+    def sync(self, database: str) -> None:
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[database]
+        primary.ensure_connection()
+        replica.ensure_connection()
+
+        # Everything committed before the copy starts is in it
+        snapshot_at = time.time()
+        start = time.perf_counter()
+        # One step, the copy reads a consistent snapshot. With WAL the
+        # primary keeps taking writes meanwhile and the replica's readers
+        # switch to the new copy once it is complete.
+        primary.connection.backup(replica.connection)
+        replicas.mark_synced(database, snapshot_at)
+        self.stdout.write(
+            f"{database}: synced in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
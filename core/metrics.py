@@ -0,0 +1,215 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import BasePermission
+
+from .friend_graph import friend_graph
+from .search_cache import search_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """
+    Prometheus style histogram with fixed buckets.
+    Counts are preallocated, an observation is a bisect and two additions.
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf, not cumulative until rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: str):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "queries", "sql_time", "response_size")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_time = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+
+HISTOGRAMS = (
+    ("latency", "http_request_duration_seconds", "Request latency in seconds."),
+    ("queries", "http_request_db_queries", "Database queries per request."),
+    ("sql_time", "http_request_db_seconds", "Time spent in SQL per request."),
+    ("response_size", "http_response_size_bytes", "Response body size in bytes."),
+)
+
+_routes = {}
+_lock = threading.Lock()
+
+
+class QueryTimer:
+    """
+    connection.execute_wrapper hook counting queries and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Records latency, DB queries, SQL time and response size per route
+    for a `SAMPLE_RATE` fraction of requests.
+
+    Under ASGI, async views run their queries through sync_to_async on the
+    request's sync thread, so the timer is installed on that thread's
+    connections.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "METRICS", {}).get("SAMPLE_RATE", 1.0)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_connections(stack, timer)
+            response = self.get_response(request)
+        record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            # Connections are per thread, wrap the ones the async ORM and
+            # sync_to_async calls of this request run on
+            await sync_to_async(wrap_connections)(stack, timer)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        record(request, response, time.perf_counter() - start, timer)
+        return response
+
+
+def wrap_connections(stack: ExitStack, timer: QueryTimer) -> None:
+    # Reads may go to a replica, see core/replicas.py
+    for conn in connections.all():
+        stack.enter_context(conn.execute_wrapper(timer))
+
+
+def record(request, response, elapsed: float, timer: QueryTimer = None) -> None:
+    match = request.resolver_match
+    key = (match.view_name if match else "unmatched", request.method)
+    with _lock:
+        metrics = _routes.get(key)
+        if metrics is None:
+            metrics = _routes[key] = RouteMetrics()
+        metrics.latency.observe(elapsed)
+        if timer is not None:
+            metrics.queries.observe(timer.count)
+            metrics.sql_time.observe(timer.seconds)
+        if not response.streaming:
+            metrics.response_size.observe(len(response.content))
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        for attr, name, help_text in HISTOGRAMS:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (route, method), metrics in sorted(_routes.items()):
+                labels = f'route="{route}",method="{method}"'
+                lines.extend(getattr(metrics, attr).samples(name, labels))
+
+    stats = friend_graph.stats()
+    lines += [
+        "# HELP friend_graph_cache_hits_total Friend graph cache hits.",
+        "# TYPE friend_graph_cache_hits_total counter",
+        f"friend_graph_cache_hits_total {stats['hits']}",
+        "# HELP friend_graph_cache_misses_total Friend graph cache misses.",
+        "# TYPE friend_graph_cache_misses_total counter",
+        f"friend_graph_cache_misses_total {stats['misses']}",
+    ]
+    stats = search_cache.stats()
+    lines += [
+        "# HELP search_cache_hits_total Search response cache hits.",
+        "# TYPE search_cache_hits_total counter",
+        f"search_cache_hits_total {stats['hits']}",
+        "# HELP search_cache_misses_total Search response cache misses.",
+        "# TYPE search_cache_misses_total counter",
+        f"search_cache_misses_total {stats['misses']}",
+        "# HELP search_cache_entries Search responses cached.",
+        "# TYPE search_cache_entries gauge",
+        f"search_cache_entries {stats['entries']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class CanReadMetrics(BasePermission):
+    """
+    Staff only, unless METRICS["PUBLIC"] opens the endpoint to scrapers
+    that can't authenticate.
+    """
+
+    def has_permission(self, request, view) -> bool:
+        if getattr(settings, "METRICS", {}).get("PUBLIC", False):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+@api_view(["GET"])
+@permission_classes([CanReadMetrics])
+def metrics_view(request):
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4")
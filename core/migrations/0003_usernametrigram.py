@@ -0,0 +1,69 @@
+# Generated by Django 4.2.12 on 2026-10-17 05:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Postings inserted per statement, and users read per chunk
+BATCH_SIZE = 5000
+
+
+def trigrams(text: str) -> set:
+    # core.search_index.trigrams as of this migration, the live module
+    # imports the current models
+    text = text.lower()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def build_index(apps, schema_editor):
+    User = apps.get_model("core", "User")
+    UsernameTrigram = apps.get_model("core", "UsernameTrigram")
+    users = User.objects.values_list("id", "username").iterator(chunk_size=BATCH_SIZE)
+    batch = []
+    for user_id, username in users:
+        batch += [
+            UsernameTrigram(trigram=t, user_id=user_id) for t in trigrams(username)
+        ]
+        if len(batch) >= BATCH_SIZE:
+            UsernameTrigram.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+            batch = []
+    UsernameTrigram.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0002_friendrequest_created_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UsernameTrigram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("trigram", models.CharField(max_length=3)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="usernametrigram",
+            constraint=models.UniqueConstraint(
+                fields=("trigram", "user"), name="unique_username_trigram"
+            ),
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.12 on 2026-10-17 05:54
+
+import logging
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+# Which duplicate is kept, the latest one on ties: an accepted request
+# matches the friendship it created, a pending one may still be answered
+KEEP_ORDER = {"accepted": 2, "pending": 1, "rejected": 0}
+
+
+def remove_duplicate_requests(apps, schema_editor):
+    """
+    Keep one request per (from_user, to_user) before the unique constraint
+    is added, and log how many of each status were deleted.
+    """
+    FriendRequest = apps.get_model("core", "FriendRequest")
+    pairs = (
+        FriendRequest.objects.values_list("from_user", "to_user")
+        .annotate(requests=Count("id"))
+        .filter(requests__gt=1)
+    )
+    deleted = Counter()
+    for from_user_id, to_user_id, _ in list(pairs):
+        rows = list(
+            FriendRequest.objects.filter(
+                from_user_id=from_user_id, to_user_id=to_user_id
+            ).values_list("id", "status")
+        )
+        keep = max(rows, key=lambda row: (KEEP_ORDER.get(row[1], -1), row[0]))
+        duplicates = [row for row in rows if row != keep]
+        FriendRequest.objects.filter(id__in=[pk for pk, _ in duplicates]).delete()
+        deleted.update(status for _, status in duplicates)
+    if deleted:
+        logger.warning(
+            "Deleted %d duplicate friend requests: %s",
+            sum(deleted.values()),
+            ", ".join(f"{count} {status}" for status, count in sorted(deleted.items())),
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_friend_suggestions"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_requests, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="friendrequest",
+            index=models.Index(fields=["to_user", "status"], name="request_inbox_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendrequest",
+            index=models.Index(
+                fields=["from_user", "status"], name="request_outbox_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="friendrequest",
+            index=models.Index(fields=["created_at"], name="request_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="friendrequest",
+            constraint=models.UniqueConstraint(
+                fields=("from_user", "to_user"), name="unique_friend_request"
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.12 on 2026-10-17 06:33
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count(apps, schema_editor):
+    User = apps.get_model("core", "User")
+    FriendRequest = apps.get_model("core", "FriendRequest")
+    pending = FriendRequest.objects.filter(status="pending")
+
+    def counted(queryset, field):
+        counts = (
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(n=Count("*"))
+            .values("n")
+        )
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    User.objects.update(
+        friend_count=counted(User.friends.through.objects.all(), "from_user_id"),
+        pending_received_count=counted(pending, "to_user_id"),
+        pending_sent_count=counted(pending, "from_user_id"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_user_token_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="friend_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="pending_received_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="pending_sent_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.12 on 2026-10-17 06:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0007_user_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedFriendRequest",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("status", models.CharField(max_length=20)),
+                ("created_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField()),
+                (
+                    "from_user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "to_user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["archived_at"], name="archived_request_purge_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.12 on 2026-10-17 06:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0008_archivedfriendrequest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="suggestionrefresh",
+            name="changed_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 
@@ -12,10 +13,24 @@ class User(AbstractUser):
         The email address of the user. It must be unique.
     friends : ManyToManyField
         A relationship field representing the friends of the user.
+    token_version : int
+        Version of the user's bearer tokens, incremented to revoke them.
+    friend_count : int
+        Number of friends, kept by core/transitions.py.
+    pending_received_count : int
+        Number of pending friend requests received.
+    pending_sent_count : int
+        Number of pending friend requests sent.
     """
 
     email = models.EmailField(unique=True)
     friends = models.ManyToManyField("self", symmetrical=True, blank=True)
+    token_version = models.PositiveIntegerField(default=0)
+    # Not positive, a drifted counter must not fail the transition
+    # decrementing it, `reconcile_counters` repairs drift
+    friend_count = models.IntegerField(default=0)
+    pending_received_count = models.IntegerField(default=0)
+    pending_sent_count = models.IntegerField(default=0)
 
 
 class FriendRequest(models.Model):
@@ -48,5 +63,128 @@ class FriendRequest(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One request per direction, also serves (from_user, to_user) lookups
+            models.UniqueConstraint(
+                fields=["from_user", "to_user"], name="unique_friend_request"
+            ),
+        ]
+        indexes = [
+            # Pending requests received by a user
+            models.Index(fields=["to_user", "status"], name="request_inbox_idx"),
+            # Pending requests sent by a user
+            models.Index(fields=["from_user", "status"], name="request_outbox_idx"),
+            models.Index(fields=["created_at"], name="request_created_idx"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.from_user}->{self.to_user}"
+
+
+class ArchivedFriendRequest(models.Model):
+    """
+    Accepted or rejected friend request moved out of FriendRequest by the
+    archive_requests command, see core/archive.py
+
+    Attributes
+    ----------
+    id : int
+        The id the request had in FriendRequest.
+    from_user : ForeignKey
+        The user who sent the friend request.
+    to_user : ForeignKey
+        The user who received the friend request.
+    status : str
+        The status of the friend request, "accepted" or "rejected".
+    created_at : DateTimeField
+        The timestamp indicating when the friend request was created.
+    archived_at : DateTimeField
+        The timestamp indicating when the friend request was archived.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["archived_at"], name="archived_request_purge_idx"),
+        ]
+
+
+class UsernameTrigram(models.Model):
+    """
+    Posting list entry of the username search index, see core/search_index.py
+
+    Attributes
+    ----------
+    trigram : str
+        A three character slice of the lowercased username.
+    user : ForeignKey
+        The user whose username contains the trigram.
+    """
+
+    trigram = models.CharField(max_length=3)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            # Also serves as the (trigram -> users) lookup index
+            models.UniqueConstraint(
+                fields=["trigram", "user"], name="unique_username_trigram"
+            ),
+        ]
+
+
+class FriendSuggestion(models.Model):
+    """
+    Precomputed "people you may know" entry, see core/suggestions.py
+
+    Attributes
+    ----------
+    user : ForeignKey
+        The user the suggestion is shown to.
+    suggested_user : ForeignKey
+        The suggested user, a friend of a friend.
+    mutual_count : int
+        The number of friends both users have in common.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="friend_suggestions"
+    )
+    suggested_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    mutual_count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "suggested_user"], name="unique_friend_suggestion"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-mutual_count"], name="suggestion_rank_idx"),
+        ]
+
+
+class SuggestionRefresh(models.Model):
+    """
+    Marks a user whose friendships changed since suggestions were computed.
+
+    Attributes
+    ----------
+    user : OneToOneField
+        The user whose edges changed.
+    changed_at : DateTimeField
+        The timestamp of the latest change. A run of compute_suggestions
+        only clears the marks it read, if changed_at is still the same.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    changed_at = models.DateTimeField(default=timezone.now)
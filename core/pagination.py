@@ -0,0 +1,120 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+from django.db.models import QuerySet
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position: int, reverse: bool = False) -> str:
+    """
+    Encode a keyset position into an opaque, url safe cursor.
+    """
+    payload = json.dumps({"p": position, "r": int(reverse)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decode a cursor made by `encode_cursor` into (position, reverse).
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(payload["p"]), bool(payload["r"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def _position(item, key: str) -> int:
+    # Items are model instances or values() dicts
+    return item[key] if isinstance(item, dict) else getattr(item, key)
+
+
+def _keyset_query(queryset: QuerySet, position, reverse: bool, key: str) -> QuerySet:
+    if reverse:
+        return queryset.filter(**{f"{key}__lt": position}).order_by(f"-{key}")
+    if position is not None:
+        return queryset.filter(**{f"{key}__gt": position}).order_by(key)
+    return queryset.order_by(key)
+
+
+def _keyset_result(items: list, position, reverse: bool, key: str, page_size: int):
+    # `items` holds up to page_size + 1 rows, the extra one tells whether
+    # there is another page
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if reverse:
+        items.reverse()
+
+    if not items:
+        return items, None, None
+
+    first, last = _position(items[0], key), _position(items[-1], key)
+    if reverse:
+        next_cursor = encode_cursor(last)
+        prev_cursor = encode_cursor(first, reverse=True) if has_more else None
+    else:
+        next_cursor = encode_cursor(last) if has_more else None
+        prev_cursor = (
+            encode_cursor(first, reverse=True) if position is not None else None
+        )
+    return items, next_cursor, prev_cursor
+
+
+def keyset_page(
+    queryset: QuerySet, cursor: Optional[str], page_size: int = 10, key: str = "id"
+) -> tuple:
+    """
+    Fetch one page of `queryset` ordered by the indexed column `key`.
+    Seeks past the cursor position instead of using OFFSET, so every page
+    costs the same no matter how deep it is.
+
+    Returns (items, next_cursor, prev_cursor).
+    """
+    position, reverse = decode_cursor(cursor) if cursor else (None, False)
+    queryset = _keyset_query(queryset, position, reverse, key)
+    items = list(queryset[: page_size + 1])
+    return _keyset_result(items, position, reverse, key, page_size)
+
+
+async def akeyset_page(
+    queryset: QuerySet, cursor: Optional[str], page_size: int = 10, key: str = "id"
+) -> tuple:
+    """
+    `keyset_page` for async views, through the async ORM.
+    """
+    position, reverse = decode_cursor(cursor) if cursor else (None, False)
+    queryset = _keyset_query(queryset, position, reverse, key)
+    items = [item async for item in queryset[: page_size + 1]]
+    return _keyset_result(items, position, reverse, key, page_size)
+
+
+def keyset_slice(ids, cursor: Optional[str], page_size: int = 10) -> tuple:
+    """
+    Same as `keyset_page` over an already sorted sequence of ids,
+    seeking with a binary search.
+
+    Returns (page_ids, next_cursor, prev_cursor).
+    """
+    position, reverse = decode_cursor(cursor) if cursor else (None, False)
+
+    if reverse:
+        end = bisect_left(ids, position)
+        start = max(0, end - page_size)
+    else:
+        start = bisect_right(ids, position) if position is not None else 0
+        end = start + page_size
+    page_ids = list(ids[start:end])
+
+    if not page_ids:
+        return page_ids, None, None
+
+    next_cursor = encode_cursor(page_ids[-1]) if end < len(ids) else None
+    prev_cursor = encode_cursor(page_ids[0], reverse=True) if start > 0 else None
+    return page_ids, next_cursor, prev_cursor
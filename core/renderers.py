@@ -0,0 +1,57 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# DRF escapes these in JSON output since they end lines in JavaScript
+_LINE_SEPARATORS = (
+    ("\u2028".encode(), b"\\u2028"),
+    ("\u2029".encode(), b"\\u2029"),
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The output is byte for byte the one of JSONRenderer: compact and
+    UTF-8. Anything orjson encodes differently falls back to
+    JSONRenderer: indented or ASCII output, and data orjson cannot
+    encode itself (non string keys). The API has no float fields, whose
+    exponent notation differs.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            # Types orjson does not know, like lazy strings or Decimals, go
+            # through the DRF encoder, and so do datetimes since orjson
+            # formats them differently
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        for separator, escaped in _LINE_SEPARATORS:
+            ret = ret.replace(separator, escaped)
+        return ret
+
+
+def render_json(data) -> bytes:
+    """
+    Render `data` like the API responses, for views outside DRF.
+    """
+    return FastJSONRenderer().render(data)
@@ -0,0 +1,191 @@
+import functools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Scope of a user's friends and friend request lists
+PROFILES_SCOPE = "profiles"
+# Scope of the user directory search reads
+DIRECTORY_SCOPE = "directory"
+
+
+class _Reads:
+    """
+    Scopes the current block reads, and the replica chosen for them.
+    Shared by the threads sync_to_async runs the block's queries in.
+    """
+
+    __slots__ = ("scopes", "database", "chosen")
+
+    def __init__(self, scopes: tuple):
+        self.scopes = scopes
+        self.database = None
+        self.chosen = False
+
+
+_reads = ContextVar("replica_reads", default=None)
+
+
+def user_scope(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def list_scopes(user_id: int) -> tuple:
+    """
+    Scopes the friends and friend request lists of `user_id` read.
+    """
+    return user_scope(user_id), PROFILES_SCOPE
+
+
+def _written_key(scope: str) -> str:
+    return f"replica_written:{scope}"
+
+
+def _synced_key(alias: str) -> str:
+    return f"replica_synced:{alias}"
+
+
+class Replicas:
+    """
+    Read replicas of the primary database, kept in sync by the
+    sync_replicas command.
+
+    Read-only views name the scopes of data they read, see list_scopes,
+    and run on a replica only if it is fresh enough: its snapshot is less
+    than `lag_window` seconds old and was taken after the last write to
+    any of the scopes. Writers record the time they wrote a scope once
+    they commit, see core/list_versions.py and core/search_cache.py, so a
+    user always reads their own writes, and so does anyone whose lists
+    they changed. If sync_replicas stops, every read goes back to the
+    primary within `lag_window` seconds.
+
+    Both timestamps live in the Django cache `alias`, shared by every
+    process.
+    """
+
+    def __init__(self, databases=(), lag_window: float = 30, alias="default"):
+        self.databases = list(databases)
+        self.lag_window = lag_window
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def mark_written(self, *scopes) -> None:
+        """
+        Record that `scopes` changed now. Call it once the write committed.
+        """
+        if self.databases:
+            now = time.time()
+            self.cache.set_many(
+                {_written_key(scope): now for scope in scopes},
+                timeout=self.lag_window,
+            )
+
+    def mark_synced(self, database: str, snapshot_at: float) -> None:
+        """
+        Record that `database` now holds the primary as of `snapshot_at`.
+        """
+        self.cache.set(_synced_key(database), snapshot_at, timeout=None)
+
+    def choose(self, *scopes) -> Optional[str]:
+        """
+        A replica fresh enough to read `scopes` from, or None for the primary.
+        """
+        if not self.databases:
+            return None
+        keys = [_synced_key(database) for database in self.databases]
+        keys += [_written_key(scope) for scope in scopes]
+        values = self.cache.get_many(keys)
+        # Writes older than the window expired, fresh replicas include them
+        oldest = time.time() - self.lag_window
+        written_at = max(
+            (values.get(_written_key(scope), 0) for scope in scopes), default=0
+        )
+        fresh = [
+            database
+            for database in self.databases
+            if values.get(_synced_key(database), 0) > max(oldest, written_at)
+        ]
+        return random.choice(fresh) if fresh else None
+
+    @contextmanager
+    def reading(self, *scopes):
+        """
+        Send the reads made inside the block to a replica fresh enough for
+        `scopes`. The replica is chosen at the first query rather than
+        here, so a version read before it, like a list ETag or the search
+        cache version, is never newer than the rows read.
+        """
+        token = _reads.set(_Reads(scopes))
+        try:
+            yield
+        finally:
+            _reads.reset(token)
+
+    def current(self) -> Optional[str]:
+        """
+        The replica the current reads go to, None for the primary.
+        """
+        reads = _reads.get()
+        if reads is None:
+            return None
+        if not reads.chosen:
+            reads.database = self.choose(*reads.scopes)
+            reads.chosen = True
+        return reads.database
+
+
+def replica_reads(scopes):
+    """
+    Run a view method's reads on a replica fresh enough for the scopes
+    returned by `scopes(request)`.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            with replicas.reading(*scopes(request)):
+                return view(self, request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the replica chosen for the current request, everything
+    else to the primary. Replicas are copies, they are never migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Reads inside a transaction must see its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replicas.current()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas.databases
+
+
+_config = getattr(settings, "READ_REPLICAS", {})
+replicas = Replicas(
+    databases=_config.get("DATABASES", ()),
+    lag_window=_config.get("LAG_WINDOW", 30),
+    alias=_config.get("CACHE_ALIAS", "default"),
+)
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .replicas import DIRECTORY_SCOPE, replicas
+
+VERSION_KEY = "user_directory_version"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key form of a search query.
+    Username matching ignores ASCII case, and a query without "@" can't be
+    an exact email match, so such queries share an entry across cases.
+    """
+    if "@" not in query and query.isascii():
+        return query.lower()
+    return query
+
+
+class SearchCache:
+    """
+    Per-process LRU cache of search responses keyed by (query, page).
+
+    Entries are stored under the user directory version they were computed
+    at. Signups and user updates bump the version, which is kept in the
+    Django cache `alias` so every process sees it, and entries of older
+    versions are never served again, they just age out of the LRU.
+    Entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300, alias="default"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def version(self) -> int:
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # Start from the clock rather than 0, if the key is evicted
+            # the version must not go back to one entries were stored at
+            self.cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+            version = self.cache.get(VERSION_KEY)
+        return version
+
+    def bump(self) -> None:
+        """
+        Invalidate every cached search, in all processes.
+        """
+        # Searches computed on a replica older than this would be cached
+        # at the new version
+        replicas.mark_written(DIRECTORY_SCOPE)
+        try:
+            self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+    def get(self, key: tuple, version: int):
+        """
+        The response data cached for `key` at `version`, or None.
+        """
+        key = (version, *key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def set(self, key: tuple, data, version: int) -> None:
+        """
+        Store `data` computed at `version`. The version must be read
+        before running the search, so a bump meanwhile leaves the entry
+        unreachable instead of serving results older than the bump.
+        """
+        key = (version, *key)
+        with self._lock:
+            self._entries[key] = (data, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
+
+
+_config = getattr(settings, "SEARCH_CACHE", {})
+search_cache = SearchCache(
+    max_entries=_config.get("MAX_ENTRIES", 1000),
+    ttl=_config.get("TTL", 300),
+    alias=_config.get("CACHE_ALIAS", "default"),
+)
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models import Count, QuerySet
+
+from .models import User, UsernameTrigram
+
+# Queries shorter than this have no trigram and fall back to a table scan
+MIN_INDEXED_LENGTH = 3
+
+
+def trigrams(text: str) -> set:
+    """
+    All three character slices of the lowercased text.
+    """
+    text = text.lower()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def index_user(user_id: int, username: str) -> None:
+    """
+    Bring the postings of one user in line with their current username.
+    Only the trigrams that changed are written.
+    """
+    wanted = trigrams(username)
+    with transaction.atomic():
+        existing = set(
+            UsernameTrigram.objects.filter(user_id=user_id).values_list(
+                "trigram", flat=True
+            )
+        )
+        stale = existing - wanted
+        if stale:
+            UsernameTrigram.objects.filter(user_id=user_id, trigram__in=stale).delete()
+        UsernameTrigram.objects.bulk_create(
+            [UsernameTrigram(trigram=t, user_id=user_id) for t in wanted - existing],
+            ignore_conflicts=True,
+        )
+
+
+def index_users(users) -> None:
+    """
+    Add postings for freshly inserted (id, username) pairs in one batch.
+    """
+    UsernameTrigram.objects.bulk_create(
+        [
+            UsernameTrigram(trigram=t, user_id=user_id)
+            for user_id, username in users
+            for t in trigrams(username)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """
+    Drop and rebuild the whole index. Returns the number of users indexed.
+    """
+    indexed = 0
+    with transaction.atomic():
+        UsernameTrigram.objects.all().delete()
+        batch = []
+        users = User.objects.values_list("id", "username").order_by("id")
+        for row in users.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) == batch_size:
+                index_users(batch)
+                indexed += len(batch)
+                batch = []
+        index_users(batch)
+        indexed += len(batch)
+    return indexed
+
+
+def search_usernames(query: str) -> QuerySet:
+    """
+    Users whose username contains `query`, case insensitive, ordered by id
+    for every kind of pagination, sync or async.
+    Same result as `username__icontains`, but candidates are found through
+    the trigram postings and only those rows are checked against the query.
+    """
+    grams = trigrams(query)
+    if len(query) < MIN_INDEXED_LENGTH or not grams:
+        return User.objects.filter(username__icontains=query).order_by("id")
+
+    candidates = (
+        UsernameTrigram.objects.filter(trigram__in=grams)
+        .values("user_id")
+        .annotate(hits=Count("trigram"))
+        .filter(hits=len(grams))
+        .values("user_id")
+    )
+    matches = User.objects.filter(id__in=candidates, username__icontains=query)
+    return matches.order_by("id")
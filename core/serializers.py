@@ -25,6 +25,92 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         fields = ["id", "from_user", "to_user", "status", "created_at"]
 
 
+class ValuesSerializer:
+    """
+    Read-only fast path for list endpoints.
+
+    Rows are fetched with values()/values_list() and mapped to the same
+    dicts the ModelSerializer would produce, without building model
+    instances, field objects or ReturnDicts.
+
+    Parameters
+    ----------
+    fields : dict
+        Output name to the lookup it is read from, in output order.
+    converters : dict, optional
+        Output name to a function turning the database value into its
+        serialized form.
+    """
+
+    def __init__(self, fields: dict, converters: dict = None):
+        converters = converters or {}
+        self.names = tuple(fields)
+        self.lookups = tuple(fields.values())
+        # Column index and converter of the columns that need one,
+        # resolved once instead of per row
+        self.converters = tuple(
+            (i, converters[name])
+            for i, name in enumerate(self.names)
+            if name in converters
+        )
+        # values() dicts are already the output when nothing is renamed
+        # or converted
+        self.plain = self.names == self.lookups and not self.converters
+
+    def queryset(self, queryset):
+        """
+        `queryset` narrowed to the serialized columns, ready to paginate.
+        """
+        if self.plain:
+            return queryset.values(*self.names)
+        return queryset.values_list(*self.lookups)
+
+    def to_representation(self, rows) -> list:
+        """
+        Serialize rows fetched from `queryset()`.
+        """
+        if self.plain:
+            return list(rows)
+        names, converters = self.names, self.converters
+        data = []
+        for row in rows:
+            row = list(row)
+            for i, convert in converters:
+                row[i] = convert(row[i])
+            data.append(dict(zip(names, row)))
+        return data
+
+    def data(self, queryset) -> list:
+        return self.to_representation(self.queryset(queryset))
+
+
+# Same output as UserSerializer(many=True)
+user_values = ValuesSerializer({"id": "id", "username": "username", "email": "email"})
+
+# Same output as FriendRequestSerializer(many=True), the related users are
+# rendered by str() which is their username
+friend_request_values = ValuesSerializer(
+    {
+        "id": "id",
+        "from_user": "from_user__username",
+        "to_user": "to_user__username",
+        "status": "status",
+        "created_at": "created_at",
+    },
+    converters={"created_at": serializers.DateTimeField().to_representation},
+)
+
+# A suggested user with the number of mutual friends
+suggestion_values = ValuesSerializer(
+    {
+        "id": "suggested_user_id",
+        "username": "suggested_user__username",
+        "email": "suggested_user__email",
+        "mutual_friends": "mutual_count",
+    }
+)
+
+
 class LoginSerializer(serializers.Serializer):
     """
     Use this serializer to validate user login credentials.
@@ -0,0 +1,175 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters, search_index, suggestions
+from .authentication import user_cache
+from .autocomplete import index as autocomplete_index
+from .friend_graph import friend_graph
+from .list_versions import list_versions
+from .models import FriendRequest, User
+from .search_cache import search_cache
+
+# User fields search results are made of
+SEARCHED_FIELDS = {"username", "email"}
+
+
+@receiver(post_save, sender=User)
+def update_search_index(sender, instance, created, update_fields, **kwargs):
+    """
+    Keep the username trigram index in sync.
+    Postings are removed with the user through the cascading foreign key.
+    """
+    if update_fields is not None and "username" not in update_fields:
+        return
+    search_index.index_user(instance.pk, instance.username)
+
+
+@receiver(post_save, sender=User)
+def update_autocomplete(sender, instance, created, update_fields, **kwargs):
+    """
+    Add new users, e.g. from signup, and renames to the autocomplete index.
+    """
+    if update_fields is not None and "username" not in update_fields:
+        return
+    autocomplete_index.add(instance.pk, instance.username, created=created)
+
+
+@receiver(post_delete, sender=User)
+def remove_from_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def invalidate_search_cache(sender, instance, created, update_fields, **kwargs):
+    """
+    Signups and changes to searched fields make cached searches stale.
+    Saves of other fields, like last_login on login, keep them.
+    """
+    if update_fields is not None and not SEARCHED_FIELDS & set(update_fields):
+        return
+    # After commit, a search running meanwhile would cache the old rows
+    # under the new version
+    transaction.on_commit(search_cache.bump)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_search_cache_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(search_cache.bump)
+
+
+@receiver(post_save, sender=User)
+def invalidate_lists_on_rename(sender, instance, created, update_fields, **kwargs):
+    """
+    Friend and friend request lists show usernames and emails, a change
+    invalidates the lists of everyone.
+    """
+    if created or (
+        update_fields is not None and not SEARCHED_FIELDS & set(update_fields)
+    ):
+        return
+    list_versions.bump_profiles()
+
+
+@receiver(post_delete, sender=User)
+def invalidate_lists_on_delete(sender, instance, **kwargs):
+    # Their friendships and requests are deleted by cascade, without signals
+    list_versions.bump_profiles()
+
+
+@receiver(pre_delete, sender=User)
+def uncount_deleted_user(sender, instance, **kwargs):
+    """
+    Their friendships and pending requests are deleted by cascade, without
+    signals, uncount them from the other users first.
+    """
+    friend_ids = User.friends.through.objects.filter(
+        from_user_id=instance.pk
+    ).values_list("to_user_id", flat=True)
+    counters.friendships_removed((instance.pk, pk) for pk in friend_ids)
+    counters.pending_removed(
+        FriendRequest.objects.filter(
+            Q(from_user_id=instance.pk) | Q(to_user_id=instance.pk), status="pending"
+        ).values_list("from_user_id", "to_user_id")
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the user from this process' token auth cache, e.g. on login
+    or deactivation.
+    """
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def update_friend_graph(sender, instance, action, pk_set, **kwargs):
+    """
+    Patch the cached friend id arrays when friendships are added or removed.
+    After commit, like add_friendships, so other threads never cache rows
+    that may still be rolled back.
+    """
+    if action == "post_add":
+        changes = [(friend_graph.add_friendship, (instance.pk, pk)) for pk in pk_set]
+    elif action == "post_remove":
+        changes = [(friend_graph.remove_friendship, (instance.pk, pk)) for pk in pk_set]
+    elif action == "pre_clear":
+        changes = [
+            (friend_graph.invalidate, (pk,))
+            for pk in friend_graph.friend_ids(instance.pk)
+        ]
+    elif action == "post_clear":
+        changes = [(friend_graph.invalidate, (instance.pk,))]
+    else:
+        return
+
+    def patch():
+        for change, args in changes:
+            change(*args)
+
+    transaction.on_commit(patch)
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def invalidate_friend_lists(sender, instance, action, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        list_versions.bump([instance.pk, *pk_set])
+    elif action == "pre_clear":
+        list_versions.bump([instance.pk, *friend_graph.friend_ids(instance.pk)])
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def queue_suggestion_refresh(sender, instance, action, pk_set, **kwargs):
+    """
+    Mark both ends of changed friendships for the next incremental
+    `compute_suggestions` run.
+    """
+    if action in ("post_add", "post_remove"):
+        suggestions.mark_changed([instance.pk, *pk_set])
+    elif action == "pre_clear":
+        suggestions.mark_changed([instance.pk, *friend_graph.friend_ids(instance.pk)])
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def update_friend_counts(sender, instance, action, pk_set, **kwargs):
+    """
+    Keep friend_count in sync with friends.add(), remove() and clear().
+    """
+    if action == "post_add":
+        # Only the new friendships. Sent before the reverse rows of the
+        # symmetric relation are inserted, so they can't be recounted yet.
+        counters.friendships_added((instance.pk, pk) for pk in pk_set)
+    elif action == "post_remove":
+        # Every given user, removed or not, recounted
+        counters.recount(
+            User.objects.filter(pk__in={instance.pk, *pk_set}), ["friend_count"]
+        )
+    elif action == "pre_clear":
+        # From the table, the cached ids may lag behind other processes
+        friend_ids = User.friends.through.objects.filter(
+            from_user_id=instance.pk
+        ).values_list("to_user_id", flat=True)
+        counters.friendships_removed((instance.pk, pk) for pk in friend_ids)
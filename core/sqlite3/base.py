@@ -0,0 +1,114 @@
+"""
+SQLite backend tuned for a web server: WAL journal, pragmas applied on
+connect, and transactions that take the write lock when they begin.
+
+Use it with ENGINE "core.sqlite3". Besides the sqlite3.connect() keyword
+arguments, OPTIONS accepts:
+
+- "pragmas": pragmas run on every new connection, merged over PRAGMAS.
+- "transaction_mode": how atomic blocks begin, "IMMEDIATE" (default),
+  "DEFERRED" or "EXCLUSIVE".
+- "lock_retries": how many times a statement failing with "database is
+  locked" is retried, see LockRetryCursor.
+"""
+
+import random
+import time
+
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    # Readers don't block the writer and the writer doesn't block readers
+    "journal_mode": "WAL",
+    # Durable at checkpoints rather than on every commit, safe with WAL
+    "synchronous": "NORMAL",
+    # Wait up to 5s for the write lock before failing with "locked"
+    "busy_timeout": 5000,
+    # Page cache per connection, negative values are KiB
+    "cache_size": -20000,
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+TRANSACTION_MODES = {"DEFERRED", "IMMEDIATE", "EXCLUSIVE"}
+
+# Base of the backoff between retries, doubled on every retry
+RETRY_DELAY = 0.05
+
+
+def is_locked(error) -> bool:
+    return "locked" in str(error)
+
+
+class LockRetryCursor(base.SQLiteCursorWrapper):
+    """
+    Retries statements failing with "database is locked" once SQLite's own
+    busy_timeout has run out, with an exponential backoff.
+
+    Only statements run outside a transaction are retried: autocommit
+    statements and the BEGIN of atomic blocks, which did nothing yet, so
+    running them again is always safe. Inside a transaction a locked
+    error is raised as is, only the whole transaction could be retried.
+    Transactions begin IMMEDIATE so they wait for the write lock at BEGIN
+    instead of failing halfway when a read is upgraded to a write.
+    """
+
+    retries = 2
+
+    def execute(self, query, params=None):
+        return self.retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        # A generator would be consumed by the first attempt
+        return self.retry(super().executemany, query, list(param_list))
+
+    def retry(self, execute, query, params):
+        attempt = 0
+        while True:
+            in_transaction = self.connection.in_transaction
+            try:
+                return execute(query, params)
+            except base.Database.OperationalError as e:
+                if in_transaction or not is_locked(e) or attempt >= self.retries:
+                    raise
+            time.sleep(RETRY_DELAY * 2**attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict["OPTIONS"]
+        self.pragmas = {**PRAGMAS, **options.get("pragmas", {})}
+        self.transaction_mode = options.get("transaction_mode", "IMMEDIATE").upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ValueError(
+                f"transaction_mode must be one of {sorted(TRANSACTION_MODES)}."
+            )
+        # A subclass per connection, so each database has its own setting
+        self.cursor_class = type(
+            "LockRetryCursor",
+            (LockRetryCursor,),
+            {"retries": options.get("lock_retries", LockRetryCursor.retries)},
+        )
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # Ours, not sqlite3.connect() arguments
+        for option in ("pragmas", "transaction_mode", "lock_retries"):
+            kwargs.pop(option, None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        # busy_timeout first, switching to WAL waits for other connections
+        conn.execute(f"PRAGMA busy_timeout = {self.pragmas['busy_timeout']}")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=self.cursor_class)
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -0,0 +1,160 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import FriendRequest, FriendSuggestion, SuggestionRefresh, User
+
+
+class AdjacencyMatrix:
+    """
+    The symmetric friends graph in compressed sparse row form.
+
+    `users` holds the sorted ids of users with at least one friend, and the
+    friends of users[i] are indices[indptr[i]:indptr[i + 1]], sorted.
+    Three flat integer arrays, 8 bytes per stored edge.
+    """
+
+    def __init__(self, users: array, indptr: array, indices: array):
+        self.users = users
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def load(cls, chunk_size: int = 10000) -> "AdjacencyMatrix":
+        """
+        Stream the friends through table, which stores both directions of
+        every friendship, into CSR arrays.
+        """
+        users, indptr, indices = array("q"), array("q", [0]), array("q")
+        edges = (
+            User.friends.through.objects.order_by("from_user_id", "to_user_id")
+            .values_list("from_user_id", "to_user_id")
+            .iterator(chunk_size=chunk_size)
+        )
+        for from_id, to_id in edges:
+            if not users or users[-1] != from_id:
+                if users:
+                    indptr.append(len(indices))
+                users.append(from_id)
+            indices.append(to_id)
+        if users:
+            indptr.append(len(indices))
+        return cls(users, indptr, indices)
+
+    def neighbors(self, user_id: int) -> array:
+        i = bisect_left(self.users, user_id)
+        if i == len(self.users) or self.users[i] != user_id:
+            return array("q")
+        return self.indices[self.indptr[i] : self.indptr[i + 1]]
+
+
+def pending_pairs(user_ids: list) -> dict:
+    """
+    For each user, the ids of users with a pending request to or from them.
+    """
+    pairs = defaultdict(set)
+    pending = FriendRequest.objects.filter(status="pending")
+    for from_id, to_id in pending.filter(from_user_id__in=user_ids).values_list(
+        "from_user_id", "to_user_id"
+    ):
+        pairs[from_id].add(to_id)
+    for from_id, to_id in pending.filter(to_user_id__in=user_ids).values_list(
+        "from_user_id", "to_user_id"
+    ):
+        pairs[to_id].add(from_id)
+    return pairs
+
+
+def rank_candidates(
+    graph: AdjacencyMatrix, user_id: int, exclude: set, limit: int
+) -> list:
+    """
+    Friends of friends of the user, ranked by the number of mutual friends.
+    Returns up to `limit` (mutual_count, candidate_id) pairs.
+    """
+    friends = graph.neighbors(user_id)
+    counts = defaultdict(int)
+    for friend_id in friends:
+        for candidate in graph.neighbors(friend_id):
+            counts[candidate] += 1
+
+    skip = set(friends)
+    skip.add(user_id)
+    skip |= exclude
+    # Negated ids make ties go to the oldest account
+    ranked = (
+        (count, -candidate)
+        for candidate, count in counts.items()
+        if candidate not in skip
+    )
+    return [(count, -neg_id) for count, neg_id in heapq.nlargest(limit, ranked)]
+
+
+def compute(user_ids, graph: AdjacencyMatrix, limit: int = 20, chunk_size: int = 1000):
+    """
+    Recompute and store the suggestions of `user_ids`, chunk by chunk.
+    Yields the number of users done after every chunk.
+    """
+    done = 0
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = list(user_ids[start : start + chunk_size])
+        pending = pending_pairs(chunk)
+        rows = []
+        for user_id in chunk:
+            ranked = rank_candidates(graph, user_id, pending.get(user_id, set()), limit)
+            rows += [
+                FriendSuggestion(
+                    user_id=user_id, suggested_user_id=candidate, mutual_count=count
+                )
+                for count, candidate in ranked
+            ]
+
+        with transaction.atomic():
+            FriendSuggestion.objects.filter(user_id__in=chunk).delete()
+            FriendSuggestion.objects.bulk_create(rows, batch_size=chunk_size)
+        done += len(chunk)
+        yield done
+
+
+def changed_users(graph: AdjacencyMatrix, marked: list) -> list:
+    """
+    Users whose suggestions may be stale: the `marked` ones and their
+    current friends, whose two hop paths went through them.
+    """
+    affected = set(marked)
+    for user_id in marked:
+        affected.update(graph.neighbors(user_id))
+    return sorted(affected)
+
+
+def mark_changed(user_ids) -> None:
+    """
+    Queue users for the next incremental recompute. Users already queued
+    get a new changed_at, so a run that read their mark before this change
+    doesn't clear it, see clear_marks.
+    """
+    now = timezone.now()
+    SuggestionRefresh.objects.bulk_create(
+        [SuggestionRefresh(user_id=user_id, changed_at=now) for user_id in user_ids],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["changed_at"],
+    )
+
+
+def clear_marks(marks: list, chunk_size: int = 400) -> None:
+    """
+    Delete the (user_id, changed_at) marks a run read. A mark updated or
+    created since, whenever its transaction commits, has another
+    changed_at or wasn't read, and is kept for the next run.
+    """
+    for start in range(0, len(marks), chunk_size):
+        read = Q()
+        for user_id, changed_at in marks[start : start + chunk_size]:
+            read |= Q(user_id=user_id, changed_at=changed_at)
+        SuggestionRefresh.objects.filter(read).delete()
@@ -0,0 +1,638 @@
+import io
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import archive, autocomplete, metrics, search_index, suggestions, transitions
+from .friend_graph import FriendGraphCache, friend_graph
+from .models import FriendRequest, SuggestionRefresh, User
+
+# Pending requests received by the fixture's user
+FIXTURE_REQUESTS = 10000
+
+
+class FriendRequestQueryCountTests(TestCase):
+    """
+    The friend request list and transitions run a fixed number of queries
+    whatever the number of requests, see FIXTURE_REQUESTS.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        cls.other = User.objects.create_user("bob", "bob@example.com", "pw")
+        senders = User.objects.bulk_create(
+            User(username=f"sender{i}", email=f"sender{i}@example.com")
+            for i in range(FIXTURE_REQUESTS)
+        )
+        FriendRequest.objects.bulk_create(
+            FriendRequest(from_user=sender, to_user=cls.user, status="pending")
+            for sender in senders
+        )
+        cls.received = list(
+            FriendRequest.objects.filter(to_user=cls.user).values_list("id", flat=True)
+        )
+
+    def setUp(self):
+        # Rate limits and list versions live in the cache
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_list(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/friend/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), FIXTURE_REQUESTS)
+
+    def test_list_received(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/friend/", {"type": "received"})
+        self.assertEqual(len(response.json()), FIXTURE_REQUESTS)
+        self.assertEqual(response.json()[0]["to_user"], "alice")
+
+    def test_send(self):
+        with self.assertNumQueries(9):
+            response = self.client.post("/api/friend/send_request/", {"to_user": "bob"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["to_user"], "bob")
+
+    def test_accept(self):
+        with self.assertNumQueries(12):
+            response = self.client.post(
+                f"/api/friend/{self.received[0]}/accept_request/"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "accepted")
+
+    def test_reject(self):
+        with self.assertNumQueries(8):
+            response = self.client.post(
+                f"/api/friend/{self.received[0]}/reject_request/"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "rejected")
+
+
+class FriendRequestIndexTests(TestCase):
+    """
+    The friend request lookups are served by the indexes of
+    0005_friendrequest_indexes rather than table scans.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        cls.other = User.objects.create_user("bob", "bob@example.com", "pw")
+
+    def setUp(self):
+        cache.clear()
+
+    def assertUsesIndex(self, queryset, index: str) -> None:
+        plan = queryset.explain()
+        self.assertIn(f"INDEX {index} ", plan)
+        # Dropped, the planner falls back to another plan. The SQL text
+        # differs from explain()'s, whose statement sqlite3 caches as
+        # planned before the drop
+        sql, params = queryset.query.sql_with_params()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX "{index}"')
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql} -- without index", params)
+                without = [row[3] for row in cursor.fetchall()]
+            transaction.set_rollback(True)
+        self.assertTrue(without)
+        self.assertFalse([step for step in without if index in step], without)
+
+    def test_inbox(self):
+        self.assertUsesIndex(
+            FriendRequest.objects.filter(to_user=self.user, status="pending"),
+            "request_inbox_idx",
+        )
+
+    def test_outbox(self):
+        self.assertUsesIndex(
+            FriendRequest.objects.filter(from_user=self.user, status="pending"),
+            "request_outbox_idx",
+        )
+
+    def test_duplicate(self):
+        # The unique_friend_request constraint is declared in the table,
+        # SQLite names its index and it can't be dropped
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA index_list(core_friendrequest)")
+            unique = [row[1] for row in cursor.fetchall() if row[3] == "u"]
+            columns = {}
+            for name in unique:
+                cursor.execute(f'PRAGMA index_info("{name}")')
+                columns[name] = [row[2] for row in cursor.fetchall()]
+        [index] = [
+            name for name in unique if columns[name] == ["from_user_id", "to_user_id"]
+        ]
+        plan = FriendRequest.objects.filter(
+            from_user=self.user, to_user=self.other
+        ).explain()
+        self.assertIn(f"INDEX {index} (from_user_id=? AND to_user_id=?)", plan)
+
+    def test_created_at(self):
+        self.assertUsesIndex(
+            FriendRequest.objects.filter(created_at__lt=timezone.now()),
+            "request_created_idx",
+        )
+
+    def test_duplicate_send_request(self):
+        self.client.force_login(self.user)
+        response = self.client.post("/api/friend/send_request/", {"to_user": "bob"})
+        self.assertEqual(response.status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/friend/send_request/", {"to_user": "bob"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "Friend request already sent."})
+        # Rejected by the unique constraint, not by a lookup beforehand
+        inserts = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('INSERT INTO "core_friendrequest"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(FriendRequest.objects.count(), 1)
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    """
+    Two threads, each with its own connection, race on the same request:
+    exactly one transition applies, and only once.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create_user("alice", "alice@example.com", "pw")
+        self.recipient = User.objects.create_user("bob", "bob@example.com", "pw")
+        # Through a transition, which counts the pending request
+        [(_, self.request, _)] = transitions.bulk_send(self.sender, ["bob"])
+        self.sender.refresh_from_db()
+        self.recipient.refresh_from_db()
+
+    def race(self, *calls) -> list:
+        """
+        Run each (transition, user) on the request in its own thread, all
+        released at once. Returns the (result, error) of each.
+        """
+        barrier = threading.Barrier(len(calls))
+        results = [None] * len(calls)
+
+        def run(i, transition, user):
+            try:
+                barrier.wait()
+                results[i] = transition(user, self.request.pk)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=run, args=(i, transition, user))
+            for i, (transition, user) in enumerate(calls)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def counts(self, user: User) -> tuple:
+        user.refresh_from_db()
+        return (
+            user.friend_count,
+            user.pending_received_count,
+            user.pending_sent_count,
+        )
+
+    def assert_one_applied(self, results: list) -> None:
+        errors = [error for _, error in results]
+        self.assertEqual(errors.count(None), 1, errors)
+        self.assertEqual(
+            [error for error in errors if error],
+            [transitions.NOT_PENDING] * (len(results) - 1),
+        )
+
+    def test_concurrent_accepts(self):
+        results = self.race(
+            (transitions.accept, self.recipient), (transitions.accept, self.recipient)
+        )
+        self.assert_one_applied(results)
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, "accepted")
+        # Both directions of the symmetric relation, once
+        self.assertEqual(User.friends.through.objects.count(), 2)
+        self.assertEqual(self.counts(self.sender), (1, 0, 0))
+        self.assertEqual(self.counts(self.recipient), (1, 0, 0))
+
+    def test_bulk_accept_of_a_request_resolved_meanwhile(self):
+        classify = transitions._classify
+
+        def classify_then_reject(*args):
+            classified = classify(*args)
+            transitions.reject(self.recipient, self.request.pk)
+            return classified
+
+        with mock.patch.object(
+            transitions, "_classify", side_effect=classify_then_reject
+        ):
+            results = transitions.bulk_accept(self.recipient, [self.request.pk])
+
+        self.assertEqual(results, [(self.request.pk, None, transitions.NOT_PENDING)])
+        self.assertFalse(User.friends.through.objects.exists())
+        self.assertEqual(self.counts(self.sender), (0, 0, 0))
+        self.assertEqual(self.counts(self.recipient), (0, 0, 0))
+
+    def test_concurrent_cancels(self):
+        results = self.race(
+            (transitions.cancel, self.sender), (transitions.cancel, self.sender)
+        )
+        errors = [error for _, error in results]
+        self.assertEqual(errors.count(None), 1, errors)
+        # The row is gone for the loser
+        self.assertIn(transitions.DOES_NOT_EXIST, errors)
+        self.assertFalse(FriendRequest.objects.exists())
+        self.assertEqual(self.counts(self.sender), (0, 0, 0))
+        self.assertEqual(self.counts(self.recipient), (0, 0, 0))
+
+    def test_accept_racing_cancel(self):
+        results = self.race(
+            (transitions.accept, self.recipient), (transitions.cancel, self.sender)
+        )
+        accept_error, cancel_error = [error for _, error in results]
+        # The cancel applies either way: before the accept it deletes the
+        # pending request, after it the accepted one and the friendship stays
+        self.assertIsNone(cancel_error)
+        self.assertIn(accept_error, (None, transitions.DOES_NOT_EXIST))
+        accepted = accept_error is None
+        self.assertFalse(FriendRequest.objects.exists())
+        self.assertEqual(User.friends.through.objects.count(), 2 if accepted else 0)
+        self.assertEqual(self.counts(self.sender), (int(accepted), 0, 0))
+        self.assertEqual(self.counts(self.recipient), (int(accepted), 0, 0))
+
+    def test_cancel_of_a_rejected_request(self):
+        transitions.reject(self.recipient, self.request.pk)
+        self.assertEqual(transitions.cancel(self.sender, self.request.pk), (True, None))
+        self.assertEqual(self.counts(self.sender), (0, 0, 0))
+        self.assertEqual(self.counts(self.recipient), (0, 0, 0))
+        # The sender can send again
+        [(_, friend_request, error)] = transitions.bulk_send(self.sender, ["bob"])
+        self.assertIsNone(error)
+        self.assertEqual(self.counts(self.sender), (0, 0, 1))
+
+
+class IncrementalSuggestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        cls.other = User.objects.create_user("bob", "bob@example.com", "pw")
+
+    def test_marks_made_during_a_run_survive_it(self):
+        suggestions.mark_changed([self.user.pk])
+        load = suggestions.AdjacencyMatrix.load
+        # Written before the run started, committed after it read the marks
+        long_ago = timezone.now() - timedelta(hours=1)
+
+        def load_then_change(*args, **kwargs):
+            graph = load(*args, **kwargs)
+            # Friendships of a marked and of an unmarked user change while
+            # the run computes from the graph loaded before
+            SuggestionRefresh.objects.bulk_create(
+                [
+                    SuggestionRefresh(user_id=user_id, changed_at=long_ago)
+                    for user_id in (self.user.pk, self.other.pk)
+                ],
+                update_conflicts=True,
+                unique_fields=["user"],
+                update_fields=["changed_at"],
+            )
+            return graph
+
+        with mock.patch.object(
+            suggestions.AdjacencyMatrix, "load", side_effect=load_then_change
+        ):
+            call_command("compute_suggestions", incremental=True, stdout=io.StringIO())
+
+        self.assertEqual(
+            set(SuggestionRefresh.objects.values_list("user_id", flat=True)),
+            {self.user.pk, self.other.pk},
+        )
+
+        call_command("compute_suggestions", incremental=True, stdout=io.StringIO())
+        self.assertFalse(SuggestionRefresh.objects.exists())
+
+
+class FriendGraphCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "pw")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "pw")
+
+    def setUp(self):
+        cache.clear()
+        for user in (self.alice, self.bob):
+            friend_graph.invalidate(user.pk)
+
+    def test_loads_overlapping_a_patch_are_not_cached(self):
+        graph = FriendGraphCache()
+        load = graph._load
+
+        def load_then_patch(user_id):
+            ids = load(user_id)
+            # Committed and patched by another thread meanwhile
+            graph.add_friendship(self.alice.pk, self.bob.pk)
+            return ids
+
+        with mock.patch.object(graph, "_load", side_effect=load_then_patch):
+            self.assertEqual(list(graph.friend_ids(self.alice.pk)), [])
+        self.assertNotIn(self.alice.pk, graph._entries)
+
+    def test_patches_wait_for_the_commit(self):
+        self.assertEqual(list(friend_graph.friend_ids(self.alice.pk)), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.friends.add(self.bob)
+            self.assertEqual(list(friend_graph.friend_ids(self.alice.pk)), [])
+        self.assertEqual(list(friend_graph.friend_ids(self.alice.pk)), [self.bob.pk])
+        self.assertEqual(list(friend_graph.friend_ids(self.bob.pk)), [self.alice.pk])
+
+
+class AsyncCursorPaginationTests(TestCase):
+    """
+    The async search and friends views page with `cursor` like their sync
+    counterparts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", "alice@example.com", "pw")
+        friends = User.objects.bulk_create(
+            User(username=f"friend{i}", email=f"friend{i}@example.com")
+            for i in range(25)
+        )
+        # bulk_create skips the signal indexing usernames
+        search_index.index_users((user.pk, user.username) for user in friends)
+        cls.user.friends.add(*friends)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def assertSamePages(self, path: str, params: dict) -> None:
+        cursor, pages = "", 0
+        while cursor is not None:
+            query = {**params, "cursor": cursor, "include_total": "true"}
+            expected = self.client.get(f"/api/{path}", query)
+            response = self.client.get(f"/api/async/{path}", query)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+            self.assertEqual(response.json()["total_users"], 25)
+            cursor = response.json()["next"]
+            pages += 1
+        self.assertEqual(pages, 3)
+
+        prev = response.json()["prev"]
+        self.assertEqual(
+            self.client.get(f"/api/async/{path}", {**params, "cursor": prev}).json(),
+            self.client.get(f"/api/{path}", {**params, "cursor": prev}).json(),
+        )
+
+    def test_friends(self):
+        self.assertSamePages("user/friends/", {})
+
+    def test_search(self):
+        self.assertSamePages("user/search/", {"query": "friend"})
+
+    def test_invalid_cursor(self):
+        for path, params in (("user/friends/", {}), ("user/search/", {"query": "a"})):
+            response = self.client.get(
+                f"/api/async/{path}", {**params, "cursor": "nope"}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"detail": "Invalid cursor."})
+
+
+class AutocompleteBackgroundTests(TransactionTestCase):
+    """
+    The autocomplete index is built and merged in a background thread,
+    lookups are answered meanwhile.
+    """
+
+    def setUp(self):
+        for name in ("userA", "userb", "other"):
+            User.objects.create_user(name, f"{name}@example.com", "pw")
+        self.ids = dict(User.objects.values_list("username", "id"))
+        self.index = autocomplete.AutocompleteIndex(
+            merge_threshold=2, refresh_interval=3600
+        )
+
+    def test_lookups_before_the_build_query_the_database(self):
+        expected = [(self.ids["userA"], "userA"), (self.ids["userb"], "userb")]
+        self.assertEqual(self.index.complete("USER"), expected)
+        self.index.wait()
+        self.assertIsNotNone(self.index.base)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.complete("USER"), expected)
+
+    def test_changes_during_the_build(self):
+        building = threading.Event()
+        release = threading.Event()
+
+        class SlowPackedUsernames(autocomplete.PackedUsernames):
+            def __init__(self, rows):
+                building.set()
+                release.wait(5)
+                super().__init__(rows)
+
+        with mock.patch.object(autocomplete, "PackedUsernames", SlowPackedUsernames):
+            self.index.start()
+            self.assertTrue(building.wait(5))
+            self.index.add(self.ids["userA"], "zed", created=False)
+            self.index.remove(self.ids["userb"])
+            self.index.add(103, "user103")
+            release.set()
+            self.index.wait()
+
+        self.assertIsNotNone(self.index.base)
+        self.assertEqual(self.index.complete("zed"), [(self.ids["userA"], "zed")])
+        self.assertEqual(self.index.complete("user"), [(103, "user103")])
+
+    def test_lookups_during_a_merge(self):
+        self.index.start()
+        self.index.wait()
+        merging = threading.Event()
+        release = threading.Event()
+
+        class SlowPackedUsernames(autocomplete.PackedUsernames):
+            def __init__(self, rows):
+                merging.set()
+                release.wait(5)
+                super().__init__(rows)
+
+        with mock.patch.object(autocomplete, "PackedUsernames", SlowPackedUsernames):
+            for user_id in (100, 101, 102):
+                self.index.add(user_id, f"user{user_id}")
+            self.assertTrue(merging.wait(5))
+
+            # Served from the old base and the delta, without waiting
+            start = time.perf_counter()
+            matches = self.index.complete("user")
+            self.assertLess(time.perf_counter() - start, 0.1)
+            self.assertEqual(len(matches), 5)
+            # Changes made while merging survive the swap
+            self.index.add(self.ids["userA"], "zed", created=False)
+            self.index.add(103, "user103")
+            release.set()
+            self.index.wait()
+
+        self.assertEqual(
+            self.index.delta,
+            [("user103", "user103", 103), ("zed", "zed", self.ids["userA"])],
+        )
+        self.assertEqual(self.index.complete("zed"), [(self.ids["userA"], "zed")])
+        self.assertEqual(
+            [username for _, username in self.index.complete("user")],
+            ["user100", "user101", "user102", "user103", "userb"],
+        )
+
+
+class SendRateLimitTests(TestCase):
+    """
+    Only sends that create a request use up the quota.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "pw")
+        for name in ("bob", "carol", "dave", "erin"):
+            User.objects.create_user(name, f"{name}@example.com", "pw")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.alice)
+
+    def send(self, to_user: str):
+        return self.client.post("/api/friend/send_request/", {"to_user": to_user})
+
+    def test_refused_sends_are_free(self):
+        self.assertEqual(self.send("bob").status_code, 201)
+        for to_user in ("alice", "nobody", "bob", "bob"):
+            self.assertEqual(self.send(to_user).status_code, 400)
+        self.assertEqual(self.send("carol").status_code, 201)
+        response = self.send("dave")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+
+        response = self.send("erin")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"detail": "Friend Request limit reached. Try after sometime."},
+        )
+        # Over the limit, the request isn't kept
+        self.assertFalse(
+            FriendRequest.objects.filter(to_user__username="erin").exists()
+        )
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.pending_sent_count, 3)
+
+
+class ArchivedRequestTests(TestCase):
+    """
+    Archiving resolved requests doesn't let the same requests be sent again.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "pw")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "pw")
+        cls.carol = User.objects.create_user("carol", "carol@example.com", "pw")
+        transitions.bulk_send(cls.alice, ["bob", "carol"])
+        transitions.bulk_reject(
+            cls.bob, [FriendRequest.objects.get(to_user=cls.bob).pk]
+        )
+        transitions.bulk_accept(
+            cls.carol, [FriendRequest.objects.get(to_user=cls.carol).pk]
+        )
+        archive.archive_batch(timezone.now() + timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.alice)
+
+    def test_send_request(self):
+        for to_user, detail in (
+            ("bob", transitions.ALREADY_SENT),
+            ("carol", transitions.ALREADY_SENT),
+        ):
+            response = self.client.post(
+                "/api/friend/send_request/", {"to_user": to_user}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"detail": detail})
+        self.assertFalse(FriendRequest.objects.exists())
+
+    def test_bulk_send(self):
+        results = transitions.bulk_send(self.alice, ["bob", "carol"])
+        self.assertEqual(
+            [(username, error) for username, _, error in results],
+            [("bob", transitions.ALREADY_SENT), ("carol", transitions.ALREADY_SENT)],
+        )
+
+    def test_other_direction(self):
+        # Only alice's request to bob was archived
+        self.client.force_login(self.bob)
+        response = self.client.post("/api/friend/send_request/", {"to_user": "alice"})
+        self.assertEqual(response.status_code, 201)
+
+    def test_export_includes_archived(self):
+        response = self.client.get("/api/friend/export/", {"output": "csv"})
+        lines = response.getvalue().decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn(",alice,bob,rejected,", lines[1])
+        self.assertIn(",alice,carol,accepted,", lines[2])
+
+
+class MetricsQueryTests(TransactionTestCase):
+    # The replica is a second connection to the test database
+    databases = {"default", "replica"}
+
+    def test_replica_queries_are_counted(self):
+        def view(request):
+            User.objects.count()
+            User.objects.using("replica").count()
+            return metrics.HttpResponse()
+
+        middleware = metrics.MetricsMiddleware(view)
+        with mock.patch.object(metrics, "record") as record:
+            middleware(RequestFactory().get("/"))
+        timer = record.call_args.args[3]
+        self.assertEqual(timer.count, 2)
+
+    def test_async_queries_are_counted(self):
+        async def view(request):
+            await User.objects.acount()
+            await User.objects.using("replica").acount()
+            return metrics.HttpResponse()
+
+        middleware = metrics.MetricsMiddleware(view)
+        with mock.patch.object(metrics, "record") as record:
+            async_to_sync(middleware)(RequestFactory().get("/"))
+        timer = record.call_args.args[3]
+        self.assertEqual(timer.count, 2)
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get("/api/metrics").status_code, 403)
+        User.objects.create_user("admin", "admin@example.com", "pw", is_staff=True)
+        self.client.login(username="admin", password="pw")
+        self.assertEqual(self.client.get("/api/metrics").status_code, 200)
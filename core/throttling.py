@@ -0,0 +1,232 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class RateLimitResult(NamedTuple):
+    """
+    Attributes
+    ----------
+    allowed : bool
+        Whether the request fits in the remaining quota.
+    limit : int
+        The number of requests allowed per period.
+    remaining : int
+        The quota left after this request.
+    reset_after : float
+        Seconds until the quota is fully available again.
+    """
+
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float
+
+    def headers(self) -> dict:
+        """
+        Remaining-quota headers to attach to the response.
+        """
+        return {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(int(self.reset_after + 0.999)),
+        }
+
+
+def parse_rate(rate: str) -> tuple:
+    """
+    Parse a DRF style rate such as "3/min" into (requests, seconds).
+    """
+    num, period = rate.split("/")
+    duration = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+    return int(num), duration
+
+
+class LocalMemoryBackend:
+    """
+    Per-process state store, bounded with LRU eviction.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def incr(self, key: str, delta: int, ttl: float, now: float) -> int:
+        with self._lock:
+            value, expires = self._data.get(key, (0, 0))
+            if expires <= now:
+                value = 0
+            value += delta
+            self._store(key, value, now + ttl)
+            return value
+
+    def get_many(self, keys: list, now: float) -> dict:
+        with self._lock:
+            found = {}
+            for key in keys:
+                value, expires = self._data.get(key, (None, 0))
+                if expires > now:
+                    found[key] = value
+            return found
+
+    def update(self, key: str, func: Callable, ttl: float, now: float):
+        with self._lock:
+            value, expires = self._data.get(key, (None, 0))
+            result, new_value = func(value if expires > now else None)
+            self._store(key, new_value, now + ttl)
+            return result
+
+    def _store(self, key, value, expires):
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+class CacheBackend:
+    """
+    State store backed by a Django cache, shared across processes when the
+    cache is (memcached, redis, database, ...).
+    """
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def incr(self, key: str, delta: int, ttl: float, now: float) -> int:
+        # add() is a no-op when the key exists, so concurrent senders
+        # race on incr() which the cache performs atomically.
+        if self.cache.add(key, delta, timeout=int(ttl) + 1):
+            return delta
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(key, delta, timeout=int(ttl) + 1)
+            return delta
+
+    def get_many(self, keys: list, now: float) -> dict:
+        return self.cache.get_many(keys)
+
+    def update(self, key: str, func: Callable, ttl: float, now: float):
+        # Read-modify-write, last writer wins under contention.
+        result, new_value = func(self.cache.get(key))
+        self.cache.set(key, new_value, timeout=int(ttl) + 1)
+        return result
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding window counter.
+    Keeps two fixed-window counters per key and weights the previous one by
+    how much of it still overlaps the sliding window.
+    """
+
+    def __init__(self, backend, limit: int, period: int, clock=time.time):
+        self.backend = backend
+        self.limit = limit
+        self.period = period
+        self.clock = clock
+
+    def consume(self, key: str, cost: int = 1) -> RateLimitResult:
+        now = self.clock()
+        window = int(now // self.period)
+        elapsed = now - window * self.period
+        current_key = f"{key}:{window}"
+        previous_key = f"{key}:{window - 1}"
+
+        previous = self.backend.get_many([previous_key], now).get(previous_key, 0)
+        weight = previous * (self.period - elapsed) / self.period
+        current = self.backend.incr(current_key, cost, 2 * self.period, now)
+
+        if weight + current > self.limit:
+            # Give the quota back, this request is not admitted
+            current = self.backend.incr(current_key, -cost, 2 * self.period, now)
+            used = weight + current
+            return RateLimitResult(
+                False,
+                self.limit,
+                max(0, int(self.limit - used)),
+                self.period - elapsed,
+            )
+
+        used = weight + current
+        return RateLimitResult(
+            True, self.limit, max(0, int(self.limit - used)), self.period - elapsed
+        )
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket holding up to `limit` tokens, refilled continuously at
+    `limit / period` tokens per second.
+    """
+
+    def __init__(self, backend, limit: int, period: int, clock=time.time):
+        self.backend = backend
+        self.limit = limit
+        self.period = period
+        self.rate = limit / period
+        self.clock = clock
+
+    def consume(self, key: str, cost: int = 1) -> RateLimitResult:
+        now = self.clock()
+
+        def take(state):
+            tokens, updated = state if state else (self.limit, now)
+            tokens = min(self.limit, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            reset_after = (self.limit - tokens) / self.rate
+            result = RateLimitResult(allowed, self.limit, int(tokens), reset_after)
+            return result, (tokens, now)
+
+        return self.backend.update(key, take, self.period, now)
+
+
+ALGORITHMS = {
+    "sliding_window": SlidingWindowLimiter,
+    "token_bucket": TokenBucketLimiter,
+}
+
+_local_backend = LocalMemoryBackend()
+
+
+def get_limiter(scope: str) -> Optional[object]:
+    """
+    Build the limiter configured for `scope` in settings.THROTTLES.
+    Returns None when the scope has no rate, i.e. throttling is disabled.
+    """
+    config = getattr(settings, "THROTTLES", {}).get(scope, {})
+    rate = config.get("RATE")
+    if not rate:
+        return None
+
+    if config.get("BACKEND", "cache") == "local":
+        backend = _local_backend
+    else:
+        backend = CacheBackend(config.get("CACHE_ALIAS", "default"))
+
+    limit, period = parse_rate(rate)
+    algorithm = ALGORITHMS[config.get("ALGORITHM", "sliding_window")]
+    return algorithm(backend, limit, period)
+
+
+def check_rate(scope: str, ident, cost: int = 1) -> Optional[RateLimitResult]:
+    """
+    Consume `cost` units of `ident`'s quota for `scope`.
+    Returns None when throttling is disabled for the scope.
+    """
+    limiter = get_limiter(scope)
+    if limiter is None:
+        return None
+    return limiter.consume(f"throttle:{scope}:{ident}", cost)
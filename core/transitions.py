@@ -0,0 +1,299 @@
+from django.db import transaction
+
+from . import counters, suggestions
+from .friend_graph import friend_graph
+from .list_versions import list_versions
+from .models import ArchivedFriendRequest, FriendRequest, User
+
+# Most items a single bulk call may carry
+MAX_BATCH_SIZE = 1000
+
+DOES_NOT_EXIST = "Friend request does not exist."
+UNAUTHORIZED = "Unauthorized."
+NOT_PENDING = "Friend request is not pending."
+ALREADY_SENT = "Friend request already sent."
+
+
+def add_friendships(pairs) -> int:
+    """
+    Insert (user_id, friend_id) friendships, both directions of the
+    symmetric relation, in one statement, skipping existing ones.
+    Bulk inserts skip m2m_changed, so the caches and friend counts are
+    updated here. Returns how many friendships were new.
+    """
+    pairs = {(min(pair), max(pair)) for pair in pairs}
+    Friendship = User.friends.through
+    # Filtering on from_user_id alone walks the unique index, adding
+    # to_user_id__in makes SQLite scan it
+    existing = Friendship.objects.filter(
+        from_user_id__in={user_id for user_id, _ in pairs}
+    ).values_list("from_user_id", "to_user_id")
+    pairs -= set(existing)
+    if not pairs:
+        return 0
+    Friendship.objects.bulk_create(
+        [
+            Friendship(from_user_id=a, to_user_id=b)
+            for user_id, friend_id in pairs
+            for a, b in ((user_id, friend_id), (friend_id, user_id))
+        ],
+        ignore_conflicts=True,
+    )
+    counters.friendships_added(pairs)
+
+    def patch_cache():
+        for user_id, friend_id in pairs:
+            friend_graph.add_friendship(user_id, friend_id)
+
+    transaction.on_commit(patch_cache)
+    user_ids = {user_id for pair in pairs for user_id in pair}
+    suggestions.mark_changed(user_ids)
+    list_versions.bump(user_ids)
+    return len(pairs)
+
+
+def send_errors(from_user_id: int, to_user_ids) -> dict:
+    """
+    Why requests from `from_user_id` can't be sent to some of `to_user_ids`
+    besides a live request, checked by the unique constraint: a request was
+    resolved and archived since. Archived requests refuse a new one until
+    purged, as the resolved request did while live.
+    Returns {to_user_id: error}, in one query.
+    """
+    archived = ArchivedFriendRequest.objects.filter(
+        from_user_id=from_user_id, to_user_id__in=set(to_user_ids)
+    ).values_list("to_user_id", flat=True)
+    return dict.fromkeys(archived, ALREADY_SENT)
+
+
+@transaction.atomic
+def bulk_send(from_user: User, usernames: list) -> list:
+    """
+    Create pending requests from `from_user` to every username.
+    Returns (username, friend_request, error) per distinct username,
+    in order.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    targets = dict(
+        User.objects.filter(username__in=usernames).values_list("username", "id")
+    )
+    errors = dict.fromkeys(
+        FriendRequest.objects.filter(
+            from_user=from_user, to_user_id__in=targets.values()
+        ).values_list("to_user_id", flat=True),
+        ALREADY_SENT,
+    )
+    errors.update(send_errors(from_user.pk, targets.values()))
+
+    results, new_requests = [], []
+    for username in usernames:
+        to_user_id = targets.get(username)
+        if username == from_user.username:
+            results.append((username, None, "Request cant be sent to yourself"))
+        elif to_user_id is None:
+            results.append((username, None, "User does not exist."))
+        elif to_user_id in errors:
+            results.append((username, None, errors[to_user_id]))
+        else:
+            friend_request = FriendRequest(
+                from_user=from_user, to_user_id=to_user_id, status="pending"
+            )
+            new_requests.append(friend_request)
+            results.append((username, friend_request, None))
+
+    FriendRequest.objects.bulk_create(new_requests)
+    counters.pending_added(
+        (from_user.pk, request.to_user_id) for request in new_requests
+    )
+    list_versions.bump(
+        [from_user.pk, *(request.to_user_id for request in new_requests)]
+    )
+    return results
+
+
+def _transition_error(pk, user: User, owner_field: str) -> str:
+    """
+    Explain why a conditional transition matched no row.
+    Only runs on the failure path.
+    """
+    row = FriendRequest.objects.filter(pk=pk).values_list(owner_field, "status").first()
+    if row is None:
+        return DOES_NOT_EXIST
+    if row[0] != user.pk:
+        return UNAUTHORIZED
+    return NOT_PENDING
+
+
+@transaction.atomic
+def accept(user: User, pk) -> tuple:
+    """
+    Accept a pending request received by `user` and add the friendship.
+    The status change is a single conditional UPDATE, so concurrent accepts
+    of the same request cannot both apply.
+    Returns (friend_request, None) or (None, error).
+    """
+    updated = FriendRequest.objects.filter(
+        pk=pk, to_user=user, status="pending"
+    ).update(status="accepted")
+    if not updated:
+        return None, _transition_error(pk, user, "to_user_id")
+
+    friend_request = FriendRequest.objects.select_related("from_user", "to_user").get(
+        pk=pk
+    )
+    counters.pending_removed([(friend_request.from_user_id, user.pk)])
+    add_friendships([(user.pk, friend_request.from_user_id)])
+    return friend_request, None
+
+
+@transaction.atomic
+def reject(user: User, pk) -> tuple:
+    """
+    Reject a pending request received by `user`.
+    Returns (friend_request, None) or (None, error).
+    """
+    updated = FriendRequest.objects.filter(
+        pk=pk, to_user=user, status="pending"
+    ).update(status="rejected")
+    if not updated:
+        return None, _transition_error(pk, user, "to_user_id")
+
+    friend_request = FriendRequest.objects.select_related("from_user", "to_user").get(
+        pk=pk
+    )
+    counters.pending_removed([(friend_request.from_user_id, user.pk)])
+    list_versions.bump([user.pk, friend_request.from_user_id])
+    return friend_request, None
+
+
+@transaction.atomic
+def cancel(user: User, pk) -> tuple:
+    """
+    Delete a request sent by `user`, pending or resolved, so a sender whose
+    request was rejected can send it again.
+    Returns (True, None) or (None, error).
+    """
+    sent = FriendRequest.objects.filter(pk=pk, from_user=user)
+    # The recipient's list changes too, read who it is before the row goes.
+    # Locked so the status read is the one deleted
+    row = sent.select_for_update().values_list("to_user_id", "status").first()
+    deleted, _ = sent.delete()
+    if not deleted:
+        return None, _transition_error(pk, user, "from_user_id")
+    to_user_id, status = row
+    if status == "pending":
+        counters.pending_removed([(user.pk, to_user_id)])
+    list_versions.bump([user.pk, to_user_id])
+    return True, None
+
+
+def _classify(ids: list, user: User, owner_field: str) -> tuple:
+    """
+    Load and lock the requested rows in one query and check each one
+    belongs to `user` through `owner_field` and is still pending.
+    Returns ({id: error}, {id: row}) where row is (from_user_id, to_user_id).
+    """
+    # Locked so the rows the UPDATE changes are the ones classified here
+    locked = FriendRequest.objects.select_for_update().filter(pk__in=ids)
+    rows = {
+        pk: (from_id, to_id, status, owner)
+        for pk, from_id, to_id, status, owner in locked.values_list(
+            "pk", "from_user_id", "to_user_id", "status", owner_field
+        )
+    }
+    errors, valid = {}, {}
+    for pk in ids:
+        if pk not in rows:
+            errors[pk] = DOES_NOT_EXIST
+        elif rows[pk][3] != user.pk:
+            errors[pk] = UNAUTHORIZED
+        elif rows[pk][2] != "pending":
+            errors[pk] = NOT_PENDING
+        else:
+            valid[pk] = rows[pk][:2]
+    return errors, valid
+
+
+def _applied(errors: dict, valid: dict, applied_ids) -> dict:
+    """
+    Narrow `valid` to the rows the write actually changed, the others were
+    resolved since _classify read them and are reported as not pending.
+    """
+    applied_ids = set(applied_ids)
+    for pk in valid.keys() - applied_ids:
+        errors[pk] = NOT_PENDING
+    return {pk: row for pk, row in valid.items() if pk in applied_ids}
+
+
+def _results(ids: list, errors: dict, done_status: str) -> list:
+    return [
+        (pk, None, errors[pk]) if pk in errors else (pk, done_status, None)
+        for pk in ids
+    ]
+
+
+@transaction.atomic
+def bulk_accept(user: User, ids: list) -> list:
+    """
+    Accept the pending requests received by `user`.
+    One select, one conditional UPDATE, one select of the rows it changed
+    and one insert into the friends table.
+    Returns (id, status, error) per distinct id.
+    """
+    ids = list(dict.fromkeys(ids))
+    errors, valid = _classify(ids, user, "to_user_id")
+    FriendRequest.objects.filter(pk__in=valid, to_user=user, status="pending").update(
+        status="accepted"
+    )
+    valid = _applied(
+        errors,
+        valid,
+        FriendRequest.objects.filter(pk__in=valid, status="accepted").values_list(
+            "pk", flat=True
+        ),
+    )
+    counters.pending_removed(valid.values())
+    add_friendships([(to_id, from_id) for from_id, to_id in valid.values()])
+    return _results(ids, errors, "accepted")
+
+
+@transaction.atomic
+def bulk_reject(user: User, ids: list) -> list:
+    """
+    Reject the pending requests received by `user`.
+    Returns (id, status, error) per distinct id.
+    """
+    ids = list(dict.fromkeys(ids))
+    errors, valid = _classify(ids, user, "to_user_id")
+    FriendRequest.objects.filter(pk__in=valid, to_user=user, status="pending").update(
+        status="rejected"
+    )
+    valid = _applied(
+        errors,
+        valid,
+        FriendRequest.objects.filter(pk__in=valid, status="rejected").values_list(
+            "pk", flat=True
+        ),
+    )
+    counters.pending_removed(valid.values())
+    list_versions.bump([user.pk, *(from_id for from_id, _ in valid.values())])
+    return _results(ids, errors, "rejected")
+
+
+@transaction.atomic
+def bulk_cancel(user: User, ids: list) -> list:
+    """
+    Delete the pending requests sent by `user`.
+    Returns (id, status, error) per distinct id.
+    """
+    ids = list(dict.fromkeys(ids))
+    errors, valid = _classify(ids, user, "from_user_id")
+    FriendRequest.objects.filter(
+        pk__in=valid, from_user=user, status="pending"
+    ).delete()
+    # Deleted are the rows gone now
+    kept = FriendRequest.objects.filter(pk__in=valid).values_list("pk", flat=True)
+    valid = _applied(errors, valid, valid.keys() - set(kept))
+    counters.pending_removed(valid.values())
+    list_versions.bump([user.pk, *(to_id for _, to_id in valid.values())])
+    return _results(ids, errors, "cancelled")
@@ -1,4 +1,7 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
+from . import async_views
+from .metrics import metrics_view
 from .auth_viewsets import UserAuthViewSet
 from .viewsets import FriendRequestViewSet, UserViewSet
 
@@ -8,4 +11,15 @@ router.register("friend", FriendRequestViewSet, basename="friend")
 router.register("user", UserViewSet, basename="user")
 
 
-urlpatterns = router.urls
+# Native async versions of the read and auth endpoints, for ASGI deployments
+async_urlpatterns = [
+    path("async/auth/login/", async_views.login, name="async-auth-login"),
+    path("async/auth/signup/", async_views.signup, name="async-auth-signup"),
+    path("async/user/search/", async_views.search, name="async-user-search"),
+    path("async/user/friends/", async_views.friends, name="async-user-friends"),
+    path("async/friend/", async_views.friend_requests, name="async-friend-list"),
+]
+
+urlpatterns = (
+    router.urls + async_urlpatterns + [path("metrics", metrics_view, name="metrics")]
+)
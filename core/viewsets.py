@@ -1,13 +1,63 @@
-from datetime import datetime, timedelta
-from django.http import HttpResponse
+import heapq
+from operator import itemgetter
+
+from django.http import HttpResponse, HttpResponseNotModified
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from .models import User, FriendRequest
-from .serializers import FriendRequestSerializer, UserSerializer
+from .autocomplete import index as autocomplete_index
+from .exports import CONTENT_TYPES, stream_rows
+from .models import ArchivedFriendRequest, FriendRequest, FriendSuggestion, User
+from .friend_graph import friend_graph, intersect_sorted
+from .list_versions import etag_matches, list_versions
+from .pagination import InvalidCursor, keyset_page, keyset_slice
+from .replicas import DIRECTORY_SCOPE, list_scopes, replica_reads
+from .search_cache import normalize_query, search_cache
+from .search_index import search_usernames
+from .serializers import (
+    FriendRequestSerializer,
+    friend_request_values,
+    suggestion_values,
+    user_values,
+)
+from . import counters, transitions
+from .throttling import check_rate
+
+
+def export_format(request):
+    """
+    Output format of an export, `output=ndjson` (default) or `output=csv`.
+    Returns None if the format is not supported.
+    """
+    output = request.query_params.get("output", "ndjson")
+    return output if output in CONTENT_TYPES else None
+
+
+def list_etag(request) -> tuple:
+    """
+    Version of the authenticated user's lists and the ETag of the
+    requested one, as (version, etag).
+    """
+    version = list_versions.version(request.user.pk)
+    variant = f"{request.get_full_path()}|{request.accepted_media_type}"
+    return version, list_versions.etag(request.user.pk, version, variant)
+
+
+def not_modified(etag: str) -> HttpResponseNotModified:
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+def invalid_export_format() -> Response:
+    return Response(
+        {"detail": 'Query parameter "output" must be "ndjson" or "csv".'},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
 
 
 class FriendRequestViewSet(viewsets.ModelViewSet):
@@ -16,14 +66,44 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
     """
 
     permission_classes = [IsAuthenticated]
-    queryset = FriendRequest.objects.all()
+    # Serializers render both users, join them up front to avoid N+1 queries
+    queryset = FriendRequest.objects.select_related("from_user", "to_user")
     serializer_class = FriendRequestSerializer
 
+    def perform_update(self, serializer) -> None:
+        friend_request = serializer.instance
+
+        def pending():
+            if friend_request.status != "pending":
+                return set()
+            return {(friend_request.from_user_id, friend_request.to_user_id)}
+
+        with transaction.atomic():
+            before = pending()
+            super().perform_update(serializer)
+            after = pending()
+            counters.pending_removed(before - after)
+            counters.pending_added(after - before)
+        list_versions.bump([friend_request.from_user_id, friend_request.to_user_id])
+
+    def perform_destroy(self, instance) -> None:
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            if instance.status == "pending":
+                counters.pending_removed([(instance.from_user_id, instance.to_user_id)])
+        list_versions.bump([instance.from_user_id, instance.to_user_id])
+
+    @replica_reads(lambda request: list_scopes(request.user.pk))
     def list(self, request, *args, **kwargs) -> Response:
         """
         List all friend requests.
         Filters by type if provided: 'received' or 'sent'.
+        Answers 304 when If-None-Match carries the current ETag.
         """
+        # Polls of an unchanged list are answered from the version alone
+        _, etag = list_etag(request)
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return not_modified(etag)
 
         # Get the type filter
         type: str = request.query_params.get("type")
@@ -31,7 +111,8 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
         # We only need the friend requests which are pending
         queryset = self.queryset.filter(status="pending")
 
-        friend_requests = []
+        # Unknown types match nothing
+        friend_requests = queryset.none()
 
         # If the filter is not specified we will fetch
         # All friend requests, whether sent or received
@@ -48,9 +129,10 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
         elif type == "sent":
             friend_requests = queryset.filter(from_user=request.user)
 
-        # Serialize the response
-        serializer = FriendRequestSerializer(friend_requests, many=True)
-        return Response(serializer.data)
+        # Serialize the response, straight from the rows
+        return Response(
+            friend_request_values.data(friend_requests), headers={"ETag": etag}
+        )
 
     @action(detail=False, methods=["post"])
     def send_request(self, request) -> Response:
@@ -84,62 +166,192 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
                 {"detail": "User does not exist."}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # find the number of requests sent in last minute
-        fr_req_in_last_min: int = FriendRequest.objects.filter(
-            created_at__gte=(datetime.now() - timedelta(minutes=1))
-        ).count()
+        # A request resolved and archived since
+        error = transitions.send_errors(from_user.pk, [to_user.pk]).get(to_user.pk)
+        if error:
+            return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        # user can not send more than 3 requests in a min.
-        if fr_req_in_last_min >= 3:
+        # Create friend request, the unique constraint on
+        # (from_user, to_user) rejects a request that already exists
+        try:
+            with transaction.atomic():
+                friend_request = FriendRequest.objects.create(
+                    from_user=from_user, to_user=to_user, status="pending"
+                )
+                # user can not send more than 3 requests in a min. Only
+                # charged once the request is valid, refused ones are free
+                rate = check_rate("send_request", from_user.pk)
+                if rate and not rate.allowed:
+                    transaction.set_rollback(True)
+                else:
+                    counters.pending_added([(from_user.pk, to_user.pk)])
+        except IntegrityError:
             return Response(
-                {"detail": "Friend Request limit reached. Try after sometime."},
+                {"detail": transitions.ALREADY_SENT},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-
-        # Check if friend request already exists
-        if FriendRequest.objects.filter(from_user=from_user, to_user=to_user).exists():
+        headers = rate.headers() if rate else None
+        if rate and not rate.allowed:
             return Response(
-                {"detail": "Friend request already sent."},
+                {"detail": "Friend Request limit reached. Try after sometime."},
                 status=status.HTTP_400_BAD_REQUEST,
+                headers=headers,
             )
-
-        # Create friend request
-        friend_request = FriendRequest.objects.create(
-            from_user=from_user, to_user=to_user, status="pending"
-        )
+        list_versions.bump([from_user.pk, to_user.pk])
 
         # Serialize and return response
         serializer = FriendRequestSerializer(friend_request)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED, headers=headers
+        )
 
-    @action(detail=True, methods=["post"])
-    def accept_request(self, request, pk=None) -> Response:
+    def bulk_items(self, request, key: str, item_type: type):
         """
-        Accept friend request.
-        Adds friend and updates request status.
+        Validate the list of `item_type` under `key` of a bulk request body.
+        Returns (items, None) or (None, error response).
         """
+        items = request.data.get(key)
+        if not isinstance(items, list) or not items:
+            error = f"{key} must be a non empty list."
+        elif len(items) > transitions.MAX_BATCH_SIZE:
+            error = f"At most {transitions.MAX_BATCH_SIZE} {key} per request."
+        elif not all(type(item) is item_type for item in items):
+            error = f"{key} must only contain {item_type.__name__} values."
+        else:
+            return items, None
+        return None, Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get friend request
-        try:
-            friend_request = FriendRequest.objects.get(pk=pk)
-        except FriendRequest.DoesNotExist:
+    @action(detail=False, methods=["post"])
+    def bulk_send(self, request) -> Response:
+        """
+        Send friend requests to a list of usernames in one transaction.
+        Returns a result per username. The requests created count against
+        the bulk_send rate limit, separate from the one of send_request.
+        """
+        usernames, error = self.bulk_items(request, "to_users", str)
+        if error:
+            return error
+
+        with transaction.atomic():
+            sent = transitions.bulk_send(request.user, usernames)
+            # Refused usernames don't use up the quota, a batch going over
+            # it is undone as a whole
+            created = sum(1 for _, friend_request, _ in sent if friend_request)
+            rate = (
+                check_rate("bulk_send", request.user.pk, created) if created else None
+            )
+            if rate and not rate.allowed:
+                transaction.set_rollback(True)
+        headers = rate.headers() if rate else None
+        if rate and not rate.allowed:
             return Response(
-                {"detail": "Friend request does not exist."},
-                status=status.HTTP_404_NOT_FOUND,
+                {"detail": "Friend Request limit reached. Try after sometime."},
+                status=status.HTTP_400_BAD_REQUEST,
+                headers=headers,
             )
 
-        # Check if request is for the authenticated user
-        if friend_request.to_user != request.user:
-            return Response(
-                {"detail": "Unauthorized."}, status=status.HTTP_401_UNAUTHORIZED
+        results = [
+            (
+                {"to_user": username, "id": friend_request.pk, "status": "pending"}
+                if friend_request
+                else {"to_user": username, "detail": error}
+            )
+            for username, friend_request, error in sent
+        ]
+        return Response({"results": results}, headers=headers)
+
+    def bulk_transition(self, request, transition) -> Response:
+        ids, error = self.bulk_items(request, "ids", int)
+        if error:
+            return error
+
+        results = [
+            (
+                {"id": pk, "status": new_status}
+                if new_status
+                else {"id": pk, "detail": error}
+            )
+            for pk, new_status, error in transition(request.user, ids)
+        ]
+        return Response({"results": results})
+
+    @action(detail=False, methods=["post"])
+    def bulk_accept(self, request) -> Response:
+        """
+        Accept a list of pending friend requests in one transaction.
+        """
+        return self.bulk_transition(request, transitions.bulk_accept)
+
+    @action(detail=False, methods=["post"])
+    def bulk_reject(self, request) -> Response:
+        """
+        Reject a list of pending friend requests in one transaction.
+        """
+        return self.bulk_transition(request, transitions.bulk_reject)
+
+    @action(detail=False, methods=["post"])
+    def bulk_cancel(self, request) -> Response:
+        """
+        Cancel a list of pending friend requests in one transaction.
+        """
+        return self.bulk_transition(request, transitions.bulk_cancel)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream every friend request sent or received by the user,
+        whatever their status, archived ones included, as NDJSON or CSV.
+        """
+        output = export_format(request)
+        if not output:
+            return invalid_export_format()
+
+        columns = ["id", "from_user", "to_user", "status", "created_at"]
+
+        def rows(model):
+            return (
+                model.objects.filter(
+                    Q(from_user=request.user) | Q(to_user=request.user)
+                )
+                .order_by("id")
+                .values_list(
+                    "id",
+                    "from_user__username",
+                    "to_user__username",
+                    "status",
+                    "created_at",
+                )
+                .iterator(chunk_size=2000)
             )
 
-        # Accept friend request
-        friend_request.status = "accepted"
-        friend_request.save()
+        # Archived requests keep their id, merge both tables in id order
+        merged = heapq.merge(
+            rows(FriendRequest), rows(ArchivedFriendRequest), key=itemgetter(0)
+        )
+        return stream_rows(columns, merged, output, "friend_requests")
+
+    # HTTP status of each transition error
+    transition_error_status = {
+        transitions.DOES_NOT_EXIST: status.HTTP_404_NOT_FOUND,
+        transitions.UNAUTHORIZED: status.HTTP_401_UNAUTHORIZED,
+        transitions.NOT_PENDING: status.HTTP_400_BAD_REQUEST,
+    }
 
-        # Add the user as a Friend
-        request.user.friends.add(friend_request.from_user)
+    def transition_error(self, error: str) -> Response:
+        return Response({"detail": error}, status=self.transition_error_status[error])
+
+    @action(detail=True, methods=["post"])
+    def accept_request(self, request, pk=None) -> Response:
+        """
+        Accept friend request.
+        Adds friend and updates request status.
+        """
+
+        # Only a pending request received by the authenticated user
+        # can be accepted, checked and updated in one statement
+        friend_request, error = transitions.accept(request.user, pk)
+        if error:
+            return self.transition_error(error)
 
         # Serialize and return response
         serializer = FriendRequestSerializer(friend_request)
@@ -152,24 +364,11 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
         Updates request status to 'rejected'.
         """
 
-        # Get friend request
-        try:
-            friend_request = FriendRequest.objects.get(pk=pk)
-        except FriendRequest.DoesNotExist:
-            return Response(
-                {"detail": "Friend request does not exist."},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        # Check if request is for the authenticated user
-        if friend_request.to_user != request.user:
-            return Response(
-                {"detail": "Unauthorized."}, status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        # Reject friend request
-        friend_request.status = "rejected"
-        friend_request.save()
+        # Only a pending request received by the authenticated user
+        # can be rejected, checked and updated in one statement
+        friend_request, error = transitions.reject(request.user, pk)
+        if error:
+            return self.transition_error(error)
 
         # Serialize and return response
         serializer = FriendRequestSerializer(friend_request)
@@ -182,23 +381,11 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
         Deletes the friend request.
         """
 
-        # Get friend request
-        try:
-            friend_request = FriendRequest.objects.get(pk=pk)
-        except FriendRequest.DoesNotExist:
-            return Response(
-                {"detail": "Friend request does not exist."},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        # Check if request is sent by the authenticated user
-        if friend_request.from_user != request.user:
-            return Response(
-                {"detail": "Unauthorized."}, status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        # Delete friend request
-        friend_request.delete()
+        # Only a request sent by the authenticated user can be cancelled,
+        # whatever its status
+        _, error = transitions.cancel(request.user, pk)
+        if error:
+            return self.transition_error(error)
 
         return HttpResponse(status=200)
 
@@ -210,11 +397,40 @@ class UserViewSet(viewsets.ViewSet):
 
     permission_classes = [IsAuthenticated]
 
+    def cursor_page(self, request, fetch_page, count) -> Response:
+        """
+        Keyset paginated response, used when the client passes `cursor`.
+        An empty cursor fetches the first page. The total is only counted
+        when asked for with `include_total=true`.
+
+        `fetch_page(cursor)` returns (users, next_cursor, prev_cursor)
+        and `count()` the total.
+        """
+        try:
+            page, next_cursor, prev_cursor = fetch_page(
+                request.query_params.get("cursor")
+            )
+        except InvalidCursor:
+            return Response(
+                {"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response_data = {
+            "results": user_values.to_representation(page),
+            "next": next_cursor,
+            "prev": prev_cursor,
+        }
+        if request.query_params.get("include_total") == "true":
+            response_data["total_users"] = count()
+        return Response(response_data)
+
     @action(detail=False, methods=["get"])
+    @replica_reads(lambda request: (DIRECTORY_SCOPE,))
     def search(self, request) -> Response:
         """
         Search users by email or username.
-        Returns paginated results with total users and pages.
+        Returns paginated results with total users and pages,
+        or cursor paginated results if `cursor` is given.
         """
         # get the query given
         query: str = request.query_params.get("query")
@@ -224,51 +440,226 @@ class UserViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        # Page responses are cached until the user directory changes
+        if "cursor" not in request.query_params:
+            page_number = request.query_params.get("page", 1)
+            key = (normalize_query(query), page_number)
+            version = search_cache.version()
+            response_data = search_cache.get(key, version)
+            if response_data is None:
+                response_data = self.search_page(query, page_number)
+                search_cache.set(key, response_data, version)
+            return Response(response_data)
+
+        email_exact_match = self.email_match(query)
+        if email_exact_match:
+            return Response(email_exact_match)
+
+        # Search users by name (case insensitive)
+        name_partial_match = user_values.queryset(search_usernames(query))
+        return self.cursor_page(
+            request,
+            lambda cursor: keyset_page(name_partial_match, cursor, 10),
+            name_partial_match.count,
+        )
+
+    def email_match(self, query: str):
+        """
+        The user whose email is exactly `query`, or None.
+        """
+        matches = user_values.data(User.objects.filter(email=query))
+        return matches[0] if matches else None
+
+    def search_page(self, query: str, page_number) -> dict:
+        """
+        Page `page_number` of the search results for `query`.
+        """
         # Search users by email, this needs to be an exact search
         # Response wont be paginated
-        email_exact_match = User.objects.filter(email=query).first()
+        email_exact_match = self.email_match(query)
         if email_exact_match:
-            serializer = UserSerializer(email_exact_match)
-            return Response(serializer.data)
+            return email_exact_match
 
         # Search users by name (case insensitive)
-        name_partial_match = User.objects.filter(username__icontains=query)
+        name_partial_match = user_values.queryset(search_usernames(query))
         paginator = Paginator(name_partial_match, 10)  # Paginate results
-        page_number = request.query_params.get("page", 1)
         page_obj = paginator.page(page_number)
         total_users = paginator.count
         total_pages = paginator.num_pages
 
-        serializer = UserSerializer(page_obj, many=True)
-        response_data = {
-            "results": serializer.data,
+        return {
+            "results": user_values.to_representation(page_obj),
             "page_number": page_number,
             "total_users": total_users,
             "total_pages": total_pages,
         }
-        return Response(response_data)
 
     @action(detail=False, methods=["get"])
+    def autocomplete(self, request) -> Response:
+        """
+        Usernames starting with the given prefix, case insensitive.
+        Served from an in-memory index, returns at most `limit` (max 50) users.
+        """
+        query: str = request.query_params.get("query")
+        if not query:
+            return Response(
+                {"detail": 'Query parameter "query" is required.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            return Response(
+                {"detail": '"limit" must be a number.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        matches = autocomplete_index.complete(query, limit)
+        results = [
+            {"id": user_id, "username": username} for user_id, username in matches
+        ]
+        return Response({"results": results})
+
+    @action(detail=False, methods=["get"])
+    @replica_reads(lambda request: list_scopes(request.user.pk))
     def friends(self, request) -> Response:
         """
         List friends of the authenticated user.
+        Returns paginated results with total users and pages,
+        or cursor paginated results if `cursor` is given.
+        Answers 304 when If-None-Match carries the current ETag.
+        """
+        # Polls of an unchanged list are answered from the version alone
+        version, etag = list_etag(request)
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return not_modified(etag)
+
+        # Fetch the ids of all the friends of a user, sorted, from the cache.
+        # Passing the version reloads them if another process changed them
+        friend_ids = friend_graph.friend_ids(request.user.pk, version[0])
+
+        def users(ids):
+            return user_values.queryset(User.objects.filter(id__in=ids).order_by("id"))
+
+        if "cursor" in request.query_params:
+
+            def fetch_page(cursor):
+                page_ids, next_cursor, prev_cursor = keyset_slice(
+                    friend_ids, cursor, 10
+                )
+                return users(page_ids), next_cursor, prev_cursor
+
+            response = self.cursor_page(request, fetch_page, lambda: len(friend_ids))
+            if response.status_code == status.HTTP_200_OK:
+                response["ETag"] = etag
+            return response
+
+        # Response needs to be paginated, only the page is loaded from the db
+        paginator = Paginator(friend_ids, 10)
+        page_number = request.query_params.get("page", 1)
+        page_obj = paginator.page(page_number)
+        total_users = paginator.count
+        total_pages = paginator.num_pages
+
+        response_data = {
+            "results": user_values.to_representation(users(page_obj.object_list)),
+            "page_number": page_number,
+            "total_users": total_users,
+            "total_pages": total_pages,
+        }
+        return Response(response_data, headers={"ETag": etag})
+
+    @action(detail=False, methods=["get"], url_path="me/counts")
+    @replica_reads(lambda request: list_scopes(request.user.pk))
+    def counts(self, request) -> Response:
+        """
+        Number of friends and of pending friend requests received and sent
+        by the authenticated user, kept on the user row.
+        Answers 304 when If-None-Match carries the current ETag.
+        """
+        _, etag = list_etag(request)
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return not_modified(etag)
+
+        # Not request.user, token auth may serve it from a cache
+        counts = User.objects.filter(pk=request.user.pk).values(*counters.FIELDS).get()
+        return Response(counts, headers={"ETag": etag})
+
+    @action(detail=False, methods=["get"], url_path="friends/export")
+    def friends_export(self, request):
+        """
+        Stream all friends of the authenticated user as NDJSON or CSV.
+        """
+        output = export_format(request)
+        if not output:
+            return invalid_export_format()
+
+        columns = ["id", "username", "email"]
+        rows = (
+            User.objects.filter(friends=request.user)
+            .order_by("id")
+            .values_list(*columns)
+            .iterator(chunk_size=2000)
+        )
+        return stream_rows(columns, rows, output, "friends")
+
+    @action(detail=True, methods=["get"])
+    def mutual_friends(self, request, pk=None) -> Response:
+        """
+        List friends the authenticated user has in common with user `pk`.
         Returns paginated results with total users and pages.
         """
-        # Fetch all the friends of a user
-        friends = request.user.friends.all()
+        if not pk.isdigit() or not User.objects.filter(pk=pk).exists():
+            return Response(
+                {"detail": "User does not exist."}, status=status.HTTP_404_NOT_FOUND
+            )
 
-        # Response needs to be paginated
-        paginator = Paginator(friends, 10)
+        # Intersect both sorted friend id arrays
+        mutual_ids = intersect_sorted(
+            friend_graph.friend_ids(request.user.pk),
+            friend_graph.friend_ids(int(pk)),
+        )
+
+        # Response needs to be paginated, only the page is loaded from the db
+        paginator = Paginator(mutual_ids, 10)
         page_number = request.query_params.get("page", 1)
         page_obj = paginator.page(page_number)
         total_users = paginator.count
         total_pages = paginator.num_pages
 
-        serializer = UserSerializer(page_obj, many=True)
+        page_users = User.objects.filter(id__in=page_obj.object_list).order_by("id")
         response_data = {
-            "results": serializer.data,
+            "results": user_values.data(page_users),
             "page_number": page_number,
             "total_users": total_users,
             "total_pages": total_pages,
         }
         return Response(response_data)
+
+    @action(detail=False, methods=["get"])
+    def suggestions(self, request) -> Response:
+        """
+        People you may know: friends of friends ranked by mutual friends.
+        Served from the table filled by the `compute_suggestions` command,
+        leaving out users who became friends or have a pending request since.
+        """
+        user: User = request.user
+        pending = FriendRequest.objects.filter(status="pending")
+        rows = (
+            FriendSuggestion.objects.filter(user=user)
+            .exclude(
+                suggested_user__in=pending.filter(from_user=user).values("to_user")
+            )
+            .exclude(
+                suggested_user__in=pending.filter(to_user=user).values("from_user")
+            )
+            .order_by("-mutual_count", "suggested_user_id")
+        )
+
+        results = [
+            row
+            for row in suggestion_values.data(rows)
+            if not friend_graph.is_friend(user.pk, row["id"])
+        ]
+        return Response({"results": results})
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -74,13 +75,49 @@ WSGI_APPLICATION = "social_network.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# core.sqlite3 is django.db.backends.sqlite3 in WAL mode with pragmas
+# applied on connect and retries of "database is locked" errors, see
+# core/sqlite3/base.py for its OPTIONS. Connections are kept across
+# requests for CONN_MAX_AGE seconds.
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "core.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "lock_retries": 2,
+        },
+        # A file rather than in-memory, the concurrency tests run threads
+        # with their own connections and WAL needs a file
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+    },
+    # Read replica, a copy of default made by `manage.py sync_replicas`
+    "replica": {
+        "ENGINE": "core.sqlite3",
+        "NAME": BASE_DIR / "db.replica.sqlite3",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    },
 }
 
+# Search and the friends and friend request lists read from the replicas in
+# DATABASES once they are fresh enough, see core/replicas.py. A replica is
+# used while its last sync is under LAG_WINDOW seconds old and newer than
+# the data the request reads, so users always read their own writes.
+# Add "replica" once `sync_replicas --interval` runs alongside the server.
+
+READ_REPLICAS = {
+    "DATABASES": [],
+    "LAG_WINDOW": 30,
+    "CACHE_ALIAS": "default",
+}
+
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -124,3 +161,107 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "core.User"
+
+# Rate limits, see core/throttling.py
+# ALGORITHM is "sliding_window" or "token_bucket". BACKEND "cache" shares
+# state across processes through CACHES[CACHE_ALIAS], "local" keeps it
+# in-process. Set RATE to None to disable a scope.
+
+THROTTLES = {
+    "send_request": {
+        "RATE": "3/min",
+        "ALGORITHM": "sliding_window",
+        "BACKEND": "cache",
+        "CACHE_ALIAS": "default",
+    },
+    # Charged per request a bulk_send creates, a contact import sends many
+    # requests at once. Refused usernames aren't charged, nor are refused
+    # send_request calls
+    "bulk_send": {
+        "RATE": "1000/hour",
+        "ALGORITHM": "sliding_window",
+        "BACKEND": "cache",
+        "CACHE_ALIAS": "default",
+    },
+}
+
+# In-memory username prefix index, see core/autocomplete.py
+# New usernames are buffered until MERGE_THRESHOLD, users created by other
+# processes are picked up every REFRESH_INTERVAL seconds.
+
+AUTOCOMPLETE = {
+    "MERGE_THRESHOLD": 10000,
+    "REFRESH_INTERVAL": 30,
+}
+
+# Per-process cache of friend id arrays, see core/friend_graph.py
+
+FRIEND_GRAPH_CACHE = {
+    "MAX_USERS": 10000,
+    "TTL": 60,
+}
+
+# Per-process cache of search responses, see core/search_cache.py
+# The user directory version invalidating it lives in CACHES[CACHE_ALIAS],
+# use a shared cache so signups in one process reach the others.
+
+SEARCH_CACHE = {
+    "MAX_ENTRIES": 1000,
+    "TTL": 300,
+    "CACHE_ALIAS": "default",
+}
+
+# Versions of each user's friends and friend request lists, behind their
+# ETags, see core/list_versions.py. Use a shared cache like SEARCH_CACHE.
+
+LIST_VERSIONS = {
+    "CACHE_ALIAS": "default",
+}
+
+# Bearer tokens returned by login, see core/authentication.py
+# Tokens expire after TTL seconds. Authenticated users are cached per
+# process for USER_TTL seconds, which bounds how long a token revoked
+# by another process keeps working there.
+
+TOKEN_AUTH = {
+    "TTL": 24 * 60 * 60,
+    "MAX_USERS": 10000,
+    "USER_TTL": 30,
+}
+
+# Thread pool login and signup hash passwords in, see core/hashing.py
+# At most MAX_PENDING hashes run or wait, further logins and signups get
+# a 503 with Retry-After. Keep it below the number of server threads.
+# WORKERS set to 0 hashes inline on the request thread.
+
+PASSWORD_HASHING = {
+    "WORKERS": 2,
+    "MAX_PENDING": 4,
+    "RETRY_AFTER": 1,
+}
+
+# Per-route request metrics served at /api/metrics, see core/metrics.py
+# SAMPLE_RATE is the fraction of requests recorded. The endpoint is staff
+# only unless PUBLIC is set, e.g. when only reachable from the scraper's
+# network.
+
+METRICS = {
+    "SAMPLE_RATE": 1.0,
+    "PUBLIC": False,
+}
+
+# JSON is encoded with orjson when it is installed, with the same output,
+# see core/renderers.py
+
+REST_FRAMEWORK = {
+    # Session first so anonymous requests still get 403 rather than 401
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+        "core.authentication.BearerTokenAuthentication",
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
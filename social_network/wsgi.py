@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "social_network.settings")
 
 application = get_wsgi_application()
+
+# Build the autocomplete index in the background while the server starts
+from core.autocomplete import index as autocomplete_index  # noqa: E402
+
+autocomplete_index.start()